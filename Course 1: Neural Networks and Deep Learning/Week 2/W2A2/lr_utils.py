@@ -1,20 +1,273 @@
+import os
+import hashlib
+import shutil
+import tempfile
 import numpy as np
 import h5py
     
     
 def load_dataset():
-    train_dataset = h5py.File('datasets/train_catvnoncat.h5', "r")
-    train_set_x_orig = np.array(train_dataset["train_set_x"][:]) # your train set features
-    train_set_y_orig = np.array(train_dataset["train_set_y"][:]) # your train set labels
+    with h5py.File('datasets/train_catvnoncat.h5', "r") as train_dataset:
+        train_set_x_orig = np.array(train_dataset["train_set_x"][:]) # your train set features
+        train_set_y_orig = np.array(train_dataset["train_set_y"][:]) # your train set labels
 
-    test_dataset = h5py.File('datasets/test_catvnoncat.h5', "r")
-    test_set_x_orig = np.array(test_dataset["test_set_x"][:]) # your test set features
-    test_set_y_orig = np.array(test_dataset["test_set_y"][:]) # your test set labels
+    with h5py.File('datasets/test_catvnoncat.h5', "r") as test_dataset:
+        test_set_x_orig = np.array(test_dataset["test_set_x"][:]) # your test set features
+        test_set_y_orig = np.array(test_dataset["test_set_y"][:]) # your test set labels
 
-    classes = np.array(test_dataset["list_classes"][:]) # the list of classes
+        classes = np.array(test_dataset["list_classes"][:]) # the list of classes
     
     train_set_y_orig = train_set_y_orig.reshape((1, train_set_y_orig.shape[0]))
     test_set_y_orig = test_set_y_orig.reshape((1, test_set_y_orig.shape[0]))
     
     return train_set_x_orig, train_set_y_orig, test_set_x_orig, test_set_y_orig, classes
 
+
+def _file_digest(path, cache_dir):
+    """
+    SHA-1 of the content of a file, remembered in cache_dir under its (path, size, mtime) so that an
+    unchanged file is hashed only once.
+    """
+    stat = os.stat(path)
+    stamp = "{}:{}:{}".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    stamp_path = os.path.join(cache_dir, hashlib.sha1(stamp.encode()).hexdigest() + ".digest")
+    
+    if os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            return f.read()
+    
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    
+    with open(stamp_path, "w") as f:
+        f.write(digest.hexdigest())
+    
+    return digest.hexdigest()
+
+def cached_arrays(name, sources, params, build, cache_dir = "datasets/cache"):
+    """
+    Return the arrays computed by build() from an on-disk .npy cache, as read-only memory maps.
+    
+    The cache entry is keyed by the content hash of the source files and by the transform parameters,
+    so it is rebuilt only when one of them changes. Loading an existing entry only maps the files:
+    it does not decode anything, and processes mapping the same entry share its pages.
+    
+    Arguments:
+    name -- short name of the dataset, used in the name of the cache entry
+    sources -- list of paths of the files read by build()
+    params -- python dictionary of the transform parameters build() depends on
+    build -- function without arguments returning a python dictionary of numpy arrays
+    cache_dir -- directory holding the cache entries
+    
+    Returns:
+    arrays -- python dictionary with the keys returned by build(), whose values are np.memmap
+    """
+    
+    os.makedirs(cache_dir, exist_ok = True)
+    
+    key = hashlib.sha1()
+    for path in sources:
+        key.update(_file_digest(path, cache_dir).encode())
+    key.update(repr(sorted(params.items())).encode())
+    entry = os.path.join(cache_dir, name + "-" + key.hexdigest()[:16])
+    
+    if not os.path.isdir(entry):
+        # Write into a private directory and rename it, so concurrent loaders never see a partial entry
+        tmp = tempfile.mkdtemp(dir = cache_dir)
+        for array_name, array in build().items():
+            # View through a plain dtype to drop the h5py string metadata, which .npy cannot store
+            np.save(os.path.join(tmp, array_name + ".npy"), array.view(np.dtype(array.dtype.str)))
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp)        # another process created the entry first
+    
+    return {file_name[:-4]: np.load(os.path.join(entry, file_name), mmap_mode = "r")
+            for file_name in os.listdir(entry) if file_name.endswith(".npy")}
+
+def load_dataset_cached(dtype = np.float64, cache_dir = "datasets/cache"):
+    """
+    Cached, memory-mapped version of load_dataset() returning the flattened images scaled to [0, 1].
+    The first call decodes the HDF5 files and writes the .npy cache, later calls only map it.
+    
+    Arguments:
+    dtype -- floating point type of the images
+    cache_dir -- directory holding the cache entries
+    
+    Returns:
+    train_set_x -- read-only np.memmap of shape (num_px * num_px * 3, number of training examples)
+    train_set_y, test_set_x, test_set_y, classes -- read-only np.memmap arrays
+    """
+    
+    def build():
+        train_set_x_orig, train_set_y, test_set_x_orig, test_set_y, classes = load_dataset()
+        train_set_x = train_set_x_orig.reshape(train_set_x_orig.shape[0], -1).T.astype(dtype)
+        test_set_x = test_set_x_orig.reshape(test_set_x_orig.shape[0], -1).T.astype(dtype)
+        train_set_x /= 255.
+        test_set_x /= 255.
+        return {"train_set_x": train_set_x, "train_set_y": train_set_y,
+                "test_set_x": test_set_x, "test_set_y": test_set_y, "classes": classes}
+    
+    params = {"flatten": True, "dtype": np.dtype(dtype).str}
+    arrays = cached_arrays("catvnoncat", ['datasets/train_catvnoncat.h5', 'datasets/test_catvnoncat.h5'], params, build, cache_dir)
+    
+    return arrays["train_set_x"], arrays["train_set_y"], arrays["test_set_x"], arrays["test_set_y"], arrays["classes"]
+
+
+
+def _backtracking_step(f, theta, cost, g, p, step, c = 1e-4, shrink = 0.5, min_step = 1e-12):
+    """
+    Backtracking (Armijo) line search along the descent direction p.
+    
+    Arguments:
+    f -- function returning the cost and the gradient at a parameter vector
+    theta, cost, g -- current parameter vector, reference cost and gradient
+    p -- descent direction
+    step -- first step tried, multiplied by shrink until the cost decreases enough
+    
+    Returns:
+    step -- accepted step
+    theta_new, cost_new, g_new -- parameter vector, cost and gradient after the step
+    """
+    slope = np.dot(g, p)
+    while True:
+        theta_new = theta + step * p
+        cost_new, g_new = f(theta_new)
+        # A nan cost (log of a saturated sigmoid) fails the comparison and shrinks the step too
+        if cost_new <= cost + c * step * slope or step < min_step:
+            return step, theta_new, cost_new, g_new
+        step *= shrink
+
+def optimize_solver(propagate, w, b, X, Y, solver = "lbfgs", tol = 1e-4, max_passes = 2000, learning_rate = 0.5, memory = 10, print_cost = False):
+    """
+    Version of the notebook's optimize() with a choice of solver, stopping when the norm of the gradient
+    falls below tol instead of after a fixed number of iterations.
+    
+    Every solver gets the cost and the gradient from propagate(); one call is one pass over the data. When
+    propagate() returns a nan cost (a sigmoid saturated to exactly 0 or 1), the solvers other than "gd"
+    recompute the cost in a stable form, so that their line searches can still compare costs.
+    Newton-CG has no Hessian of its own either: its Hessian-vector products are forward differences of two
+    propagate() gradients, one extra pass each.
+    
+    Arguments:
+    propagate -- the notebook's propagate(w, b, X, Y), returning (grads, cost)
+    w -- weights, a numpy array of size (num_px * num_px * 3, 1)
+    b -- bias, a scalar
+    X -- data of shape (num_px * num_px * 3, number of examples)
+    Y -- true "label" vector (containing 0 if non-cat, 1 if cat), of shape (1, number of examples)
+    solver -- "gd" (fixed step, as optimize()), "line_search" (gradient descent with a backtracking line
+              search), "lbfgs" or "newton_cg"
+    tol -- the optimization stops once the 2-norm of the gradient of (w, b) is below tol
+    max_passes -- maximum number of passes over the data, i.e. of propagate() calls
+    learning_rate -- step of "gd", and first step tried by the first "line_search" iteration
+    memory -- number of (step, gradient change) pairs kept by "lbfgs"
+    print_cost -- True to print the cost at every iteration
+    
+    Returns:
+    params -- dictionary containing the weights w and bias b
+    grads -- dictionary containing the gradients of the weights and bias at the returned parameters
+    costs -- list of the cost at every iteration
+    n_passes -- number of passes over the data the optimization needed
+    """
+    
+    n_passes = [0]
+    n = w.shape[0]
+    
+    def f(theta):
+        n_passes[0] += 1
+        grads, cost = propagate(theta[:n].reshape(n, 1), theta[n], X, Y)
+        if np.isnan(cost) and solver != "gd":
+            # 0 * log(0) once the sigmoid saturates: recompute the cost in log-sum-exp form, one more pass
+            n_passes[0] += 1
+            z = np.dot(theta[:n], X) + theta[n]
+            cost = np.mean(np.logaddexp(0, z) - Y.ravel() * z)
+        return float(cost), np.append(grads["dw"].ravel(), grads["db"])
+    
+    theta = np.append(np.asarray(w, dtype = np.float64).ravel(), b)
+    cost, g = f(theta)
+    costs = [cost]
+    step = learning_rate
+    s_list, y_list = [], []
+    
+    i = 0
+    while np.linalg.norm(g) >= tol and n_passes[0] < max_passes:
+        if solver == "gd":
+            theta = theta - learning_rate * g
+            cost, g = f(theta)
+        
+        elif solver == "line_search":
+            # First step from the Barzilai-Borwein rule, accepted against the highest of the last 10 costs:
+            # a monotone Armijo search on this ill-conditioned cost settles on tiny steps
+            if s_list:
+                step = np.dot(s_list[-1], s_list[-1]) / max(np.dot(s_list[-1], y_list[-1]), 1e-12)
+            _, theta_new, cost, g_new = _backtracking_step(f, theta, max(costs[-10:]), g, -g, step)
+            s_list, y_list = [theta_new - theta], [g_new - g]
+            theta, g = theta_new, g_new
+        
+        elif solver == "lbfgs":
+            # Two-loop recursion: p = -H g, H approximating the inverse Hessian from the last steps
+            p = -g
+            alphas = []
+            for s, y in reversed(list(zip(s_list, y_list))):
+                alpha = np.dot(s, p) / np.dot(y, s)
+                p = p - alpha * y
+                alphas.append(alpha)
+            if s_list:
+                p = p * (np.dot(s_list[-1], y_list[-1]) / np.dot(y_list[-1], y_list[-1]))
+            else:
+                p = p * min(1.0, 1.0 / np.linalg.norm(g))
+            for (s, y), alpha in zip(zip(s_list, y_list), reversed(alphas)):
+                beta = np.dot(y, p) / np.dot(y, s)
+                p = p + (alpha - beta) * s
+            
+            _, theta_new, cost, g_new = _backtracking_step(f, theta, cost, g, p, 1.0)
+            s, y = theta_new - theta, g_new - g
+            if np.dot(s, y) > 1e-10:                  # keep the approximation positive definite
+                s_list.append(s)
+                y_list.append(y)
+                if len(s_list) > memory:
+                    s_list.pop(0)
+                    y_list.pop(0)
+            theta, g = theta_new, g_new
+        
+        elif solver == "newton_cg":
+            # Truncated conjugate gradient on H p = -g
+            g_norm = np.linalg.norm(g)
+            cg_tol = min(0.5, np.sqrt(g_norm)) * g_norm
+            p = np.zeros_like(g)
+            r = -g
+            d = r.copy()
+            for _ in range(n + 1):
+                eps = np.sqrt(np.finfo(np.float64).eps) * (1 + np.linalg.norm(theta)) / np.linalg.norm(d)
+                Hd = (f(theta + eps * d)[1] - g) / eps
+                curvature = np.dot(d, Hd)
+                if curvature <= 0:
+                    if not p.any():
+                        p = -g                        # negative curvature at the first step: fall back to -g
+                    break
+                alpha = np.dot(r, r) / curvature
+                p = p + alpha * d
+                r_new = r - alpha * Hd
+                if np.linalg.norm(r_new) < cg_tol or n_passes[0] >= max_passes:
+                    break
+                d = r_new + (np.dot(r_new, r_new) / np.dot(r, r)) * d
+                r = r_new
+            _, theta, cost, g = _backtracking_step(f, theta, cost, g, p, 1.0)
+        
+        else:
+            raise ValueError("Unknown solver: " + str(solver))
+        
+        costs.append(cost)
+        if print_cost:
+            print ("Cost after iteration %i: %f (%i passes)" %(i, cost, n_passes[0]))
+        i += 1
+    
+    params = {"w": theta[:n].reshape(n, 1),
+              "b": theta[n]}
+    
+    grads = {"dw": g[:n].reshape(n, 1),
+             "db": g[n]}
+    
+    return params, grads, costs, n_passes[0]
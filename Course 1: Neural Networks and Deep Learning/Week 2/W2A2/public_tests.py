@@ -144,3 +144,34 @@ def model_test(target):
     
     print('\033[92mAll tests passed!')
     
+
+def optimize_solver_test(target):
+    def propagate(w, b, X, Y):
+        m = X.shape[1]
+        A = 1 / (1 + np.exp(-(np.dot(w.T, X) + b)))
+        cost = -np.sum(Y * np.log(A) + (1 - Y) * np.log(1 - A)) / m
+        grads = {"dw": np.dot(X, (A - Y).T) / m,
+                 "db": np.sum(A - Y) / m}
+        return grads, np.squeeze(cost)
+    
+    # Linearly separable, so the cost keeps decreasing towards 0 and the sigmoid saturates on the way
+    np.random.seed(1)
+    X = np.random.randn(3, 40)
+    Y = (X[0:1] + 0.5 * X[1:2] - 0.2 > 0).astype(float)
+    
+    # Fixed-step gradient descent stalls on the saturated cost long before the other solvers' tolerance
+    for solver, tol in [("gd", 1e-2), ("line_search", 1e-4), ("lbfgs", 1e-4), ("newton_cg", 1e-4)]:
+        with np.errstate(all = "ignore"):
+            params, grads, costs, n_passes = target(propagate, np.zeros((3, 1)), 0., X, Y, solver = solver, tol = tol, max_passes = 2000)
+        
+        grad_norm = np.linalg.norm(np.append(grads["dw"].ravel(), grads["db"]))
+        assert grad_norm < tol, f"{solver} stopped at a gradient norm of {grad_norm}, above tol = {tol}"
+        assert n_passes < 2000, f"{solver} used all its passes"
+        assert params["w"].shape == (3, 1), f"Wrong shape for params['w'] with {solver}"
+        with np.errstate(all = "ignore"):
+            expected_grads, expected_cost = propagate(params["w"], params["b"], X, Y)
+        assert np.allclose(grads["dw"], expected_grads["dw"]) and np.isclose(grads["db"], expected_grads["db"]), \
+            f"{solver} must return the gradient at the returned parameters"
+        assert costs[-1] < costs[0], f"{solver} must decrease the cost"
+    
+    print('\033[92mAll tests passed!')
@@ -1,19 +1,117 @@
-import matplotlib.pyplot as plt
+import hashlib
+import os
+from multiprocessing import Pool
 import numpy as np
-import sklearn
-import sklearn.datasets
-import sklearn.linear_model
 
-def plot_decision_boundary(model, X, y):
+_boundary_cache = {}
+
+def parameters_hash(parameters):
+    """
+    Hash the values of a parameters dictionary (or of a single array), used as the decision boundary cache key.
+    
+    Arguments:
+    parameters -- python dictionary of numpy arrays, or a numpy array
+    
+    Returns:
+    digest -- hexadecimal SHA-1 digest of the keys, dtypes, shapes and values
+    """
+    digest = hashlib.sha1()
+    items = sorted(parameters.items()) if isinstance(parameters, dict) else [("", parameters)]
+    for key, value in items:
+        value = np.ascontiguousarray(value)
+        digest.update(str((key, value.dtype.str, value.shape)).encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+def _evaluate_points(model, px, py, tile_size):
+    """
+    Evaluate model on the points (px[i], py[i]), tile_size points per call.
+    """
+    values = np.empty(px.size)
+    for start in range(0, px.size, tile_size):
+        stop = start + tile_size
+        values[start:stop] = np.ravel(model(np.c_[px[start:stop], py[start:stop]]))
+    return values
+
+def decision_boundary_grid(model, x_range, y_range, target_pixels = 250000, levels = 4, threshold = 0.5, tile_size = 65536):
+    """
+    Evaluate model on a regular grid of about target_pixels points covering x_range by y_range.
+    
+    The model is first evaluated on every 2**levels-th grid point. Each level then halves the spacing, and only
+    the cells whose corners straddle threshold are evaluated at the new points (adaptive quadtree); the other
+    cells are filled by interpolating their corners, which is exact for the 0/1 labels returned by the usual
+    predict functions. Decision regions narrower than a coarse cell can therefore be missed.
+    
+    Arguments:
+    model -- function mapping an (n, 2) array of points to n outputs
+    x_range -- (x_min, x_max)
+    y_range -- (y_min, y_max)
+    target_pixels -- approximate number of grid points, sets the resolution
+    levels -- number of refinement levels
+    threshold -- decision threshold on the model output
+    tile_size -- maximum number of points passed to model in a single call
+    
+    Returns:
+    xx, yy -- grid coordinates, as returned by np.meshgrid
+    Z -- model output on the grid, same shape as xx
+    """
+    x_min, x_max = x_range
+    y_min, y_max = y_range
+    step = np.sqrt((x_max - x_min) * (y_max - y_min) / target_pixels)
+    s = 2 ** levels
+    xs = np.linspace(x_min, x_max, max(1, int(np.ceil((x_max - x_min) / (step * s)))) * s + 1)
+    ys = np.linspace(y_min, y_max, max(1, int(np.ceil((y_max - y_min) / (step * s)))) * s + 1)
+    Z = np.empty((ys.size, xs.size))
+    
+    # Coarsest level: evaluate every s-th point
+    iy, ix = np.meshgrid(np.arange(0, ys.size, s), np.arange(0, xs.size, s), indexing = 'ij')
+    Z[::s, ::s] = _evaluate_points(model, xs[ix.ravel()], ys[iy.ravel()], tile_size).reshape(ix.shape)
+    
+    while s > 1:
+        h = s // 2
+        G = Z[::h, ::h]                       # view of the grid at the new spacing, known points at even indices
+        C = G[::2, ::2]
+        corners = np.stack([C[:-1, :-1], C[:-1, 1:], C[1:, :-1], C[1:, 1:]])
+        refine = (corners.min(axis = 0) <= threshold) & (corners.max(axis = 0) > threshold)
+        
+        # Interpolate the new points, then evaluate those of the cells that straddle the threshold
+        G[1::2, ::2] = (C[:-1, :] + C[1:, :]) / 2
+        G[::2, 1::2] = (C[:, :-1] + C[:, 1:]) / 2
+        G[1::2, 1::2] = corners.mean(axis = 0)
+        evaluate = np.zeros(G.shape, dtype = bool)
+        ci, cj = np.nonzero(refine)
+        for di, dj in ((1, 1), (0, 1), (2, 1), (1, 0), (1, 2)):
+            evaluate[2 * ci + di, 2 * cj + dj] = True
+        gi, gj = np.nonzero(evaluate)
+        G[gi, gj] = _evaluate_points(model, xs[gj * h], ys[gi * h], tile_size)
+        s = h
+    
+    xx, yy = np.meshgrid(xs, ys)
+    return xx, yy, Z
+
+def plot_decision_boundary(model, X, y, parameters = None, target_pixels = 250000, levels = 4):
+    """
+    Plot the decision regions of model over the data range, see decision_boundary_grid().
+    
+    Passing the parameters the model was built from caches the grid under their hash and the plotting
+    range, so re-plotting the same model is free.
+    """
+    import matplotlib.pyplot as plt
     # Set min and max values and give it some padding
     x_min, x_max = X[0, :].min() - 1, X[0, :].max() + 1
     y_min, y_max = X[1, :].min() - 1, X[1, :].max() + 1
-    h = 0.01
-    # Generate a grid of points with distance h between them
-    xx, yy = np.meshgrid(np.arange(x_min, x_max, h), np.arange(y_min, y_max, h))
-    # Predict the function value for the whole grid
-    Z = model(np.c_[xx.ravel(), yy.ravel()])
-    Z = Z.reshape(xx.shape)
+    key = None
+    if parameters is not None:
+        key = (parameters_hash(parameters), x_min, x_max, y_min, y_max, target_pixels, levels)
+    if key is not None and key in _boundary_cache:
+        xx, yy, Z = _boundary_cache[key]
+    else:
+        # Predict the function value on the grid, refining only around the boundary
+        xx, yy, Z = decision_boundary_grid(model, (x_min, x_max), (y_min, y_max), target_pixels, levels)
+        if key is not None:
+            _boundary_cache[key] = (xx, yy, Z)
+            if len(_boundary_cache) > 8:
+                del _boundary_cache[next(iter(_boundary_cache))]
     # Plot the contour and training examples
     plt.contourf(xx, yy, Z, cmap=plt.cm.Spectral)
     plt.ylabel('x2')
@@ -55,7 +153,131 @@ def load_planar_dataset():
 
     return X, Y
 
+_toy_noise = {"flower": 0.2, "moons": 0.2, "circles": 0.3, "blobs": 1.0}
+
+def toy_dataset_chunk(kind, m, index, seed = 0, chunk_size = 65536, noise = None, dtype = np.float64):
+    """
+    Generate chunk number index of a synthetic 2D dataset of m examples, see generate_toy_dataset().
+    
+    Each chunk draws from its own random stream, seeded by (seed, index), so the chunks can be generated in
+    any order and in separate processes. The dataset therefore depends on seed and chunk_size, not on the
+    order or the process in which the chunks are generated.
+    
+    Arguments:
+    kind -- "flower", "moons", "circles" or "blobs"
+    m -- number of examples of the whole dataset
+    index -- index of the chunk, covering examples index*chunk_size to (index+1)*chunk_size - 1
+    seed -- seed of the dataset
+    chunk_size -- number of examples per chunk
+    noise -- standard deviation of the gaussian noise, defaults to 0.2 for "flower" and "moons", 0.3 for
+             "circles" and 1.0 for "blobs"
+    dtype -- dtype of X
+    
+    Returns:
+    X -- data of the chunk, numpy array of shape (2, number of examples in the chunk)
+    Y -- labels of the chunk, numpy array of shape (1, number of examples in the chunk)
+    """
+    if kind not in _toy_noise:
+        raise ValueError("Unknown dataset kind: " + str(kind))
+    noise = _toy_noise[kind] if noise is None else noise
+    n_classes = 6 if kind == "blobs" else 2
+    i = np.arange(index * chunk_size, min((index + 1) * chunk_size, m))
+    n = i.size
+    rng = np.random.default_rng([seed, index])
+    
+    # Classes are interleaved: example i belongs to class i % n_classes, at position k along that class
+    Y = i % n_classes
+    k = i // n_classes
+    n_class = (m - Y + n_classes - 1) // n_classes   # number of examples of each example's class
+    
+    if kind == "flower":
+        a = 4 # maximum ray of the flower
+        t = (Y + k / np.maximum(n_class - 1, 1)) * 3.12 + rng.standard_normal(n) * noise # theta
+        r = a * np.sin(4 * t) + rng.standard_normal(n) * noise # radius
+        X = np.stack([r * np.sin(t), r * np.cos(t)])
+    elif kind == "moons":
+        t = np.pi * k / np.maximum(n_class - 1, 1)
+        X = np.where(Y == 0, np.stack([np.cos(t), np.sin(t)]), np.stack([1 - np.cos(t), 0.5 - np.sin(t)]))
+        X += rng.standard_normal((2, n)) * noise
+    elif kind == "circles":
+        t = 2 * np.pi * k / n_class
+        X = np.where(Y == 0, 1.0, 0.5) * np.stack([np.cos(t), np.sin(t)]) + rng.standard_normal((2, n)) * noise
+    else:
+        centers = np.random.default_rng(seed).uniform(-10, 10, (2, n_classes))
+        X = centers[:, Y] + rng.standard_normal((2, n)) * noise
+    
+    return X.astype(dtype, copy = False), Y.reshape(1, n).astype('uint8')
+
+def toy_dataset_chunks(kind, m, seed = 0, chunk_size = 65536, noise = None, dtype = np.float64):
+    """
+    Stream a synthetic 2D dataset of m examples in chunks of chunk_size examples, see toy_dataset_chunk().
+    
+    Yields:
+    (X, Y) -- data of shape (2, n) and labels of shape (1, n) of each chunk, in order
+    """
+    for index in range(-(-m // chunk_size)):
+        yield toy_dataset_chunk(kind, m, index, seed, chunk_size, noise, dtype)
+
+def _toy_chunk_job(job):
+    """
+    Pool worker of generate_toy_dataset(): generates one chunk and writes it to the .npy files, or returns it.
+    """
+    path, kind, m, index, seed, chunk_size, noise, dtype = job
+    X, Y = toy_dataset_chunk(kind, m, index, seed, chunk_size, noise, dtype)
+    if path is None:
+        return X, Y
+    start = index * chunk_size
+    for name, chunk in (("X.npy", X), ("Y.npy", Y)):
+        out = np.load(os.path.join(path, name), mmap_mode = "r+")
+        out[:, start:start + chunk.shape[1]] = chunk
+        out.flush()
+    return None
+
+def generate_toy_dataset(kind = "flower", m = 400, seed = 0, chunk_size = 65536, noise = None, dtype = np.float64, path = None, n_jobs = 1):
+    """
+    Generate a synthetic 2D dataset of m examples, vectorised chunk by chunk into preallocated arrays: the
+    "flower" of planar_utils.load_planar_dataset(), or "moons", "circles" and "blobs" shaped like the
+    sklearn.datasets make_moons, make_circles and make_blobs datasets.
+    
+    Arguments:
+    kind, m, seed, chunk_size, noise, dtype -- see toy_dataset_chunk()
+    path -- if given, directory where X and Y are written as X.npy and Y.npy memory-mapped files, so that m
+            can exceed the available memory
+    n_jobs -- number of processes generating the chunks
+    
+    Returns:
+    X -- data, numpy array (or memmap) of shape (2, m)
+    Y -- labels, numpy array (or memmap) of shape (1, m)
+    """
+    if path is None:
+        X = np.empty((2, m), dtype = dtype)
+        Y = np.empty((1, m), dtype = 'uint8')
+    else:
+        os.makedirs(path, exist_ok = True)
+        X = np.lib.format.open_memmap(os.path.join(path, "X.npy"), mode = "w+", dtype = dtype, shape = (2, m))
+        Y = np.lib.format.open_memmap(os.path.join(path, "Y.npy"), mode = "w+", dtype = 'uint8', shape = (1, m))
+    
+    jobs = [(path, kind, m, index, seed, chunk_size, noise, dtype) for index in range(-(-m // chunk_size))]
+    if n_jobs > 1:
+        # With a path the workers write straight into the shared files and return nothing
+        with Pool(n_jobs) as pool:
+            for index, chunk in enumerate(pool.imap(_toy_chunk_job, jobs)):
+                if chunk is not None:
+                    start = index * chunk_size
+                    X[:, start:start + chunk[0].shape[1]], Y[:, start:start + chunk[1].shape[1]] = chunk
+    else:
+        for index, (X_chunk, Y_chunk) in enumerate(toy_dataset_chunks(kind, m, seed, chunk_size, noise, dtype)):
+            start = index * chunk_size
+            X[:, start:start + X_chunk.shape[1]] = X_chunk
+            Y[:, start:start + Y_chunk.shape[1]] = Y_chunk
+    
+    if path is not None:
+        X.flush()
+        Y.flush()
+    return X, Y
+
 def load_extra_datasets():  
+    import sklearn.datasets
     N = 200
     noisy_circles = sklearn.datasets.make_circles(n_samples=N, factor=.5, noise=.3)
     noisy_moons = sklearn.datasets.make_moons(n_samples=N, noise=.2)
@@ -63,4 +285,195 @@ def load_extra_datasets():
     gaussian_quantiles = sklearn.datasets.make_gaussian_quantiles(mean=None, cov=0.5, n_samples=N, n_features=2, n_classes=2, shuffle=True, random_state=None)
     no_structure = np.random.rand(N, 2), np.random.rand(N, 2)
     
-    return noisy_circles, noisy_moons, blobs, gaussian_quantiles, no_structure
\ No newline at end of file
+    return noisy_circles, noisy_moons, blobs, gaussian_quantiles, no_structure
+
+def initialize_parameters_stacked(n_x, hidden_sizes, n_y, seed = 3):
+    """
+    Initialize one model per hidden layer size, stacked along a leading axis and zero-padded to the largest
+    size. Each model gets the same values as nn_model(), which re-seeds with np.random.seed(3) before
+    initialize_parameters().
+    
+    Arguments:
+    n_x -- size of the input layer
+    hidden_sizes -- list of hidden layer sizes, one per model
+    n_y -- size of the output layer
+    seed -- seed used before initializing each model
+    
+    Returns:
+    parameters -- python dictionary containing the stacked parameters:
+                    W1 -- weight matrices of shape (N, n_max, n_x)
+                    b1 -- bias vectors of shape (N, n_max, 1)
+                    W2 -- weight matrices of shape (N, n_y, n_max)
+                    b2 -- bias vectors of shape (N, n_y, 1)
+    mask -- numpy array of shape (N, n_max, 1), 1 for the hidden units each model really has, 0 for the padding
+    """
+    N = len(hidden_sizes)
+    n_max = max(hidden_sizes)
+    
+    parameters = {"W1": np.zeros((N, n_max, n_x)),
+                  "b1": np.zeros((N, n_max, 1)),
+                  "W2": np.zeros((N, n_y, n_max)),
+                  "b2": np.zeros((N, n_y, 1))}
+    mask = np.zeros((N, n_max, 1))
+    
+    for i, n_h in enumerate(hidden_sizes):
+        np.random.seed(seed)
+        parameters["W1"][i, :n_h] = np.random.randn(n_h, n_x) * 0.01
+        parameters["W2"][i, :, :n_h] = np.random.randn(n_y, n_h) * 0.01
+        mask[i, :n_h] = 1
+    
+    return parameters, mask
+
+def forward_propagation_stacked(X, parameters):
+    """
+    forward_propagation() of the one hidden layer model, for all the stacked models at once.
+    
+    Arguments:
+    X -- input data of size (n_x, m), shared by all the models
+    parameters -- output of initialize_parameters_stacked()
+    
+    Returns:
+    A2 -- The sigmoid outputs of the models, of shape (N, 1, m)
+    cache -- a dictionary containing "Z1", "A1", "Z2" and "A2"
+    """
+    Z1 = np.matmul(parameters["W1"], X) + parameters["b1"]
+    A1 = np.tanh(Z1)
+    Z2 = np.matmul(parameters["W2"], A1) + parameters["b2"]
+    A2 = sigmoid(Z2)
+    
+    cache = {"Z1": Z1,
+             "A1": A1,
+             "Z2": Z2,
+             "A2": A2}
+    
+    return A2, cache
+
+def compute_cost_stacked(A2, Y):
+    """
+    Cross-entropy cost of each of the stacked models.
+    
+    Arguments:
+    A2 -- output of forward_propagation_stacked(), of shape (N, 1, number of examples)
+    Y -- "true" labels vector of shape (1, number of examples)
+    
+    Returns:
+    costs -- numpy array of shape (N,), the cost of each model
+    """
+    m = Y.shape[1]
+    logprobs = np.multiply(np.log(A2), Y) + np.multiply(np.log(1 - A2), (1 - Y))
+    costs = - (1/m) * np.sum(logprobs, axis = (1, 2))
+    
+    return costs
+
+def backward_propagation_stacked(parameters, cache, X, Y, mask):
+    """
+    backward_propagation() of the one hidden layer model, for all the stacked models at once. The gradients of
+    the padded hidden units are masked to zero, so the padding never affects the real units.
+    
+    Arguments:
+    parameters -- output of initialize_parameters_stacked()
+    cache -- output of forward_propagation_stacked()
+    X -- input data of shape (2, number of examples)
+    Y -- "true" labels vector of shape (1, number of examples)
+    mask -- output of initialize_parameters_stacked()
+    
+    Returns:
+    grads -- python dictionary containing the stacked gradients
+    """
+    m = X.shape[1]
+    W2 = parameters["W2"]
+    A1 = cache["A1"]
+    A2 = cache["A2"]
+    
+    dZ2 = A2 - Y
+    dW2 = (1/m) * np.matmul(dZ2, A1.transpose(0, 2, 1))
+    db2 = (1/m) * np.sum(dZ2, axis = 2, keepdims = True)
+    dZ1 = (W2.transpose(0, 2, 1) * dZ2) * (1 - np.power(A1, 2)) * mask
+    dW1 = (1/m) * np.matmul(dZ1, X.T)
+    db1 = (1/m) * np.sum(dZ1, axis = 2, keepdims = True)
+    
+    grads = {"dW1": dW1,
+             "db1": db1,
+             "dW2": dW2,
+             "db2": db2}
+    
+    return grads
+
+def update_parameters_stacked(parameters, grads, learning_rate = 1.2):
+    """
+    Gradient descent update of all the stacked models.
+    
+    Arguments:
+    parameters -- python dictionary containing the stacked parameters
+    grads -- output of backward_propagation_stacked()
+    
+    Returns:
+    parameters -- python dictionary containing the updated stacked parameters
+    """
+    parameters = {"W1": parameters["W1"] - learning_rate * grads["dW1"],
+                  "b1": parameters["b1"] - learning_rate * grads["db1"],
+                  "W2": parameters["W2"] - learning_rate * grads["dW2"],
+                  "b2": parameters["b2"] - learning_rate * grads["db2"]}
+    
+    return parameters
+
+def nn_model_stacked(X, Y, hidden_sizes, num_iterations = 10000, learning_rate = 1.2, max_padding = 2.0, print_cost = False):
+    """
+    Train one nn_model() per hidden layer size in vectorised runs, instead of one Python loop per size.
+    
+    The sizes are sorted and grouped so that zero-padding a group to its largest size at most multiplies its
+    number of hidden units by max_padding: stacking [1, 2, 3, 4, 5] saves the interpreter overhead of the small
+    models, while padding a 1-unit model to 50 units would cost more than it saves. Each group is trained with
+    initialize_parameters_stacked() and the *_stacked() steps. The learnt parameters match those of nn_model()
+    up to floating-point rounding, the matrix products summing over padded dimensions.
+    
+    Arguments:
+    X -- dataset of shape (2, number of examples)
+    Y -- labels of shape (1, number of examples)
+    hidden_sizes -- list of hidden layer sizes, e.g. [1, 2, 3, 4, 5, 20, 50]
+    num_iterations -- Number of iterations in gradient descent loop
+    learning_rate -- learning rate of the gradient descent update rule
+    max_padding -- maximum ratio between the padded and the real number of hidden units of a group;
+                   float("inf") trains all the models in a single stack
+    print_cost -- if True, print the cost of every model every 1000 iterations
+    
+    Returns:
+    parameters_list -- list of the parameters learnt by each model, unpadded, in the order of hidden_sizes
+    """
+    n_x = X.shape[0]
+    n_y = Y.shape[0]
+    
+    # Group the models by size
+    order = sorted(range(len(hidden_sizes)), key = lambda i: hidden_sizes[i])
+    groups = []
+    for i in order:
+        group = groups[-1] if groups else None
+        if group is not None:
+            sizes = [hidden_sizes[j] for j in group] + [hidden_sizes[i]]
+            if len(sizes) * max(sizes) <= max_padding * sum(sizes):
+                group.append(i)
+                continue
+        groups.append([i])
+    
+    parameters_list = [None] * len(hidden_sizes)
+    for group in groups:
+        sizes = [hidden_sizes[j] for j in group]
+        parameters, mask = initialize_parameters_stacked(n_x, sizes, n_y)
+        
+        for i in range(0, num_iterations):
+            A2, cache = forward_propagation_stacked(X, parameters)
+            costs = compute_cost_stacked(A2, Y)
+            grads = backward_propagation_stacked(parameters, cache, X, Y, mask)
+            parameters = update_parameters_stacked(parameters, grads, learning_rate)
+            
+            # Print the costs every 1000 iterations
+            if print_cost and i % 1000 == 0:
+                print ("Cost after iteration %i for hidden sizes %s: %s" %(i, sizes, np.array2string(costs, precision = 6)))
+        
+        for k, (j, n_h) in enumerate(zip(group, sizes)):
+            parameters_list[j] = {"W1": parameters["W1"][k, :n_h].copy(),
+                                  "b1": parameters["b1"][k, :n_h].copy(),
+                                  "W2": parameters["W2"][k, :, :n_h].copy(),
+                                  "b2": parameters["b2"][k].copy()}
+    
+    return parameters_list
@@ -1,65 +1,191 @@
+import os
+import math
+import queue
+import hashlib
+import shutil
+import tempfile
+import subprocess
+import sys
+import threading
+import time
 import numpy as np
-import matplotlib.pyplot as plt
-import h5py
+# matplotlib, h5py and scipy are imported inside the functions that use them, so that importing
+# the numerical functions alone stays cheap (see benchmark_import())
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from multiprocessing import Pool, shared_memory
+import json
 
 
-def sigmoid(Z):
+# Per-layer profiling state, None when profiling is off (see start_profiling())
+_profile = None
+
+def start_profiling():
+    """
+    Start recording, for every layer and phase ("linear", "activation", "activation_backward", "linear_backward"),
+    the wall time, estimated FLOPs and bytes allocated by the forward and backward building blocks.
+    When profiling is off, each building block only pays one check of a module variable.
+    
+    Profiling may run while several threads call the building blocks (e.g. predict_batch() with n_jobs > 1):
+    each thread attributes its calls to its own current layer, and the records are updated under a lock.
+    """
+    global _profile
+    _profile = {"thread": threading.local(), "lock": threading.Lock(), "records": {}}
+
+def stop_profiling():
+    """
+    Stop profiling.
+    
+    Returns:
+    records -- list of python dictionaries, one per (layer, phase), with keys "layer", "phase", "calls",
+               "seconds", "flops", "bytes_allocated" and "gflops_per_second"
+    """
+    global _profile
+    profile, _profile = _profile, None
+    records = []
+    if profile is not None:
+        with profile["lock"]:
+            records = list(profile["records"].values())
+    
+    for record in records:
+        record["gflops_per_second"] = record["flops"] / record["seconds"] / 1e9 if record["seconds"] > 0 else 0.
+    
+    return records
+
+def profiling_report(records, as_json = False):
+    """
+    Format the output of stop_profiling() as a text table (default) or as a JSON string.
+    """
+    if as_json:
+        return json.dumps(records, indent = 2)
+    
+    lines = ["{:>5}  {:<20} {:>7} {:>10} {:>10} {:>10} {:>9}".format("layer", "phase", "calls", "time (ms)", "GFLOP", "alloc (MB)", "GFLOP/s")]
+    for record in records:
+        lines.append("{:>5}  {:<20} {:>7} {:>10.2f} {:>10.3f} {:>10.2f} {:>9.2f}".format(
+            str(record["layer"]), record["phase"], record["calls"], 1000 * record["seconds"], record["flops"] / 1e9,
+            record["bytes_allocated"] / 2**20, record["gflops_per_second"]))
+    
+    return "\n".join(lines)
+
+def _profile_layer(l):
+    """
+    Attribute the following building-block calls of the calling thread to layer l, when profiling.
+    """
+    profile = _profile
+    if profile is not None:
+        profile["thread"].layer = l
+
+def _profile_phase(phase, start, flops, bytes_allocated):
+    """
+    Add one call of phase, started at time start, to the record of the calling thread's current layer.
+    """
+    seconds = time.perf_counter() - start
+    profile = _profile
+    if profile is None:                       # stopped by another thread since the call started
+        return
+    layer = getattr(profile["thread"], "layer", None)
+    with profile["lock"]:
+        key = (layer, phase)
+        if key not in profile["records"]:
+            profile["records"][key] = {"layer": layer, "phase": phase, "calls": 0, "seconds": 0.,
+                                       "flops": 0, "bytes_allocated": 0}
+        record = profile["records"][key]
+        record["calls"] += 1
+        record["seconds"] += seconds
+        record["flops"] += flops
+        record["bytes_allocated"] += bytes_allocated
+
+
+def sigmoid(Z, out=None):
     """
     Implements the sigmoid activation in numpy
     
     Arguments:
     Z -- numpy array of any shape
+    out -- optional preallocated array of the same shape as Z to write A into
     
     Returns:
     A -- output of sigmoid(z), same shape as Z
     cache -- returns Z as well, useful during backpropagation
     """
     
-    A = 1/(1+np.exp(-Z))
+    if _profile is not None:
+        start = time.perf_counter()
+    
+    if out is None:
+        A = 1/(1+np.exp(-Z))
+    else:
+        # Same operations as above, evaluated in place in "out"
+        A = np.negative(Z, out=out)
+        np.exp(A, out=A)
+        np.add(1, A, out=A)
+        np.divide(1, A, out=A)
     cache = Z
     
+    if _profile is not None:
+        _profile_phase("activation", start, 4 * Z.size, A.nbytes if out is None else 0)
+    
     return A, cache
 
-def relu(Z):
+def relu(Z, out=None):
     """
     Implement the RELU function.
 
     Arguments:
     Z -- Output of the linear layer, of any shape
+    out -- optional preallocated array of the same shape as Z to write A into
 
     Returns:
     A -- Post-activation parameter, of the same shape as Z
     cache -- a python dictionary containing "A" ; stored for computing the backward pass efficiently
     """
     
-    A = np.maximum(0,Z)
+    if _profile is not None:
+        start = time.perf_counter()
+    
+    A = np.maximum(0, Z, out=out)
     
     assert(A.shape == Z.shape)
     
+    if _profile is not None:
+        _profile_phase("activation", start, Z.size, A.nbytes if out is None else 0)
+    
     cache = Z 
     return A, cache
 
 
-def relu_backward(dA, cache):
+def relu_backward(dA, cache, out=None):
     """
     Implement the backward propagation for a single RELU unit.
 
     Arguments:
     dA -- post-activation gradient, of any shape
     cache -- 'Z' where we store for computing backward propagation efficiently
+    out -- optional preallocated array of the same shape as dA to write dZ into
 
     Returns:
     dZ -- Gradient of the cost with respect to Z
     """
     
-    Z = cache
-    dZ = np.array(dA, copy=True) # just converting dz to a correct object.
+    if _profile is not None:
+        start = time.perf_counter()
     
-    # When z <= 0, you should set dz to 0 as well. 
-    dZ[Z <= 0] = 0
+    Z = cache
+    if out is None:
+        dZ = np.array(dA, copy=True) # just converting dz to a correct object.
+        
+        # When z <= 0, you should set dz to 0 as well. 
+        dZ[Z <= 0] = 0
+    else:
+        # Step function (1 where z > 0, 0 where z <= 0) times dA, without a boolean mask
+        dZ = np.heaviside(Z, 0, out=out)
+        np.multiply(dZ, dA, out=dZ)
     
     assert (dZ.shape == Z.shape)
     
+    if _profile is not None:
+        _profile_phase("activation_backward", start, Z.size, dZ.nbytes if out is None else 0)
+    
     return dZ
 
 def sigmoid_backward(dA, cache):
@@ -74,6 +200,9 @@ def sigmoid_backward(dA, cache):
     dZ -- Gradient of the cost with respect to Z
     """
     
+    if _profile is not None:
+        start = time.perf_counter()
+    
     Z = cache
     
     s = 1/(1+np.exp(-Z))
@@ -81,19 +210,23 @@ def sigmoid_backward(dA, cache):
     
     assert (dZ.shape == Z.shape)
     
+    if _profile is not None:
+        _profile_phase("activation_backward", start, 7 * Z.size, 4 * dZ.nbytes)
+    
     return dZ
 
 
 def load_data():
-    train_dataset = h5py.File('datasets/train_catvnoncat.h5', "r")
-    train_set_x_orig = np.array(train_dataset["train_set_x"][:]) # your train set features
-    train_set_y_orig = np.array(train_dataset["train_set_y"][:]) # your train set labels
+    import h5py
+    with h5py.File('datasets/train_catvnoncat.h5', "r") as train_dataset:
+        train_set_x_orig = np.array(train_dataset["train_set_x"][:]) # your train set features
+        train_set_y_orig = np.array(train_dataset["train_set_y"][:]) # your train set labels
 
-    test_dataset = h5py.File('datasets/test_catvnoncat.h5', "r")
-    test_set_x_orig = np.array(test_dataset["test_set_x"][:]) # your test set features
-    test_set_y_orig = np.array(test_dataset["test_set_y"][:]) # your test set labels
+    with h5py.File('datasets/test_catvnoncat.h5', "r") as test_dataset:
+        test_set_x_orig = np.array(test_dataset["test_set_x"][:]) # your test set features
+        test_set_y_orig = np.array(test_dataset["test_set_y"][:]) # your test set labels
 
-    classes = np.array(test_dataset["list_classes"][:]) # the list of classes
+        classes = np.array(test_dataset["list_classes"][:]) # the list of classes
     
     train_set_y_orig = train_set_y_orig.reshape((1, train_set_y_orig.shape[0]))
     test_set_y_orig = test_set_y_orig.reshape((1, test_set_y_orig.shape[0]))
@@ -101,6 +234,228 @@ def load_data():
     return train_set_x_orig, train_set_y_orig, test_set_x_orig, test_set_y_orig, classes
 
 
+def flatten_normalize(X_orig, dtype=np.float64):
+    """
+    Flatten images into columns and scale their pixel values to [0, 1], directly in the requested dtype
+    (dividing the uint8 images by 255. would otherwise always produce float64).
+    
+    Arguments:
+    X_orig -- images of shape (number of examples, num_px, num_px, 3), as returned by load_data()
+    dtype -- floating point type of the result, e.g. np.float32 for reduced-precision training
+    
+    Returns:
+    X -- array of shape (num_px * num_px * 3, number of examples)
+    """
+    
+    X = X_orig.reshape(X_orig.shape[0], -1).T.astype(dtype)
+    X /= 255.
+    
+    return X
+
+
+def _file_digest(path, cache_dir):
+    """
+    SHA-1 of the content of a file, remembered in cache_dir under its (path, size, mtime) so that an
+    unchanged file is hashed only once.
+    """
+    stat = os.stat(path)
+    stamp = "{}:{}:{}".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    stamp_path = os.path.join(cache_dir, hashlib.sha1(stamp.encode()).hexdigest() + ".digest")
+    
+    if os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            return f.read()
+    
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    
+    with open(stamp_path, "w") as f:
+        f.write(digest.hexdigest())
+    
+    return digest.hexdigest()
+
+def cached_arrays(name, sources, params, build, cache_dir = "datasets/cache"):
+    """
+    Return the arrays computed by build() from an on-disk .npy cache, as read-only memory maps.
+    
+    The cache entry is keyed by the content hash of the source files and by the transform parameters,
+    so it is rebuilt only when one of them changes. Loading an existing entry only maps the files:
+    it does not decode anything, and processes mapping the same entry share its pages.
+    
+    Arguments:
+    name -- short name of the dataset, used in the name of the cache entry
+    sources -- list of paths of the files read by build()
+    params -- python dictionary of the transform parameters build() depends on
+    build -- function without arguments returning a python dictionary of numpy arrays
+    cache_dir -- directory holding the cache entries
+    
+    Returns:
+    arrays -- python dictionary with the keys returned by build(), whose values are np.memmap
+    """
+    
+    os.makedirs(cache_dir, exist_ok = True)
+    
+    key = hashlib.sha1()
+    for path in sources:
+        key.update(_file_digest(path, cache_dir).encode())
+    key.update(repr(sorted(params.items())).encode())
+    entry = os.path.join(cache_dir, name + "-" + key.hexdigest()[:16])
+    
+    if not os.path.isdir(entry):
+        # Write into a private directory and rename it, so concurrent loaders never see a partial entry
+        tmp = tempfile.mkdtemp(dir = cache_dir)
+        for array_name, array in build().items():
+            # View through a plain dtype to drop the h5py string metadata, which .npy cannot store
+            np.save(os.path.join(tmp, array_name + ".npy"), array.view(np.dtype(array.dtype.str)))
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp)        # another process created the entry first
+    
+    return {file_name[:-4]: np.load(os.path.join(entry, file_name), mmap_mode = "r")
+            for file_name in os.listdir(entry) if file_name.endswith(".npy")}
+
+def load_data_cached(dtype=np.float64, cache_dir = "datasets/cache"):
+    """
+    Cached, memory-mapped version of load_data() followed by flatten_normalize().
+    The first call decodes the HDF5 files and writes the .npy cache, later calls only map it.
+    
+    Arguments:
+    dtype -- floating point type of the images
+    cache_dir -- directory holding the cache entries
+    
+    Returns:
+    train_x -- read-only np.memmap of shape (num_px * num_px * 3, number of training examples), values in [0, 1]
+    train_y, test_x, test_y, classes -- read-only np.memmap arrays
+    """
+    
+    def build():
+        train_x_orig, train_y, test_x_orig, test_y, classes = load_data()
+        return {"train_x": flatten_normalize(train_x_orig, dtype), "train_y": train_y,
+                "test_x": flatten_normalize(test_x_orig, dtype), "test_y": test_y, "classes": classes}
+    
+    params = {"flatten": True, "dtype": np.dtype(dtype).str}
+    arrays = cached_arrays("catvnoncat", ['datasets/train_catvnoncat.h5', 'datasets/test_catvnoncat.h5'], params, build, cache_dir)
+    
+    return arrays["train_x"], arrays["train_y"], arrays["test_x"], arrays["test_y"], arrays["classes"]
+
+def h5_mini_batches(path, x_name="train_set_x", y_name="train_set_y", mini_batch_size = 64, window_size = 1024, seed = 0,
+                    dtype=np.float64):
+    """
+    Stream one epoch of shuffled, flattened and normalized mini-batches straight from an HDF5 file,
+    holding at most about window_size examples in memory instead of the whole dataset.
+    
+    The dataset is read in contiguous blocks aligned on its HDF5 chunks. Each window gathers randomly
+    chosen blocks, its columns are shuffled, and full mini-batches are emitted; examples left over at the
+    end of a window are carried into the next one, so only the very last mini-batch can be smaller.
+    
+    Arguments:
+    path -- path of the HDF5 file, e.g. 'datasets/train_catvnoncat.h5'
+    x_name -- name of the images dataset, of shape (number of examples, num_px, num_px, 3)
+    y_name -- name of the labels dataset, of shape (number of examples,)
+    mini_batch_size -- number of examples in each mini-batch
+    window_size -- approximate number of examples read and shuffled together
+    seed -- seed of the shuffling, pass a different one for every epoch
+    dtype -- floating point type of the mini-batches
+    
+    Yields:
+    mini_batch_X -- array of shape (num_px * num_px * 3, mini_batch_size), values between 0 and 1
+    mini_batch_Y -- array of shape (1, mini_batch_size)
+    """
+    import h5py
+    
+    rng = np.random.RandomState(seed)
+    
+    with h5py.File(path, "r") as dataset:
+        X_dataset = dataset[x_name]
+        Y_dataset = dataset[y_name]
+        m = X_dataset.shape[0]
+        block_size = X_dataset.chunks[0] if X_dataset.chunks is not None else mini_batch_size
+        blocks_per_window = max(1, -(-max(window_size, mini_batch_size) // block_size))
+        
+        block_starts = np.arange(0, m, block_size)
+        rng.shuffle(block_starts)
+        
+        X_left = np.zeros((int(np.prod(X_dataset.shape[1:])), 0), dtype=dtype)
+        Y_left = np.zeros((1, 0), dtype=dtype)
+        
+        for k in range(0, len(block_starts), blocks_per_window):
+            # Read the blocks of this window in file order, one contiguous slice each
+            starts = np.sort(block_starts[k:k + blocks_per_window])
+            X_window = np.concatenate([X_dataset[s:s + block_size] for s in starts])
+            Y_window = np.concatenate([Y_dataset[s:s + block_size] for s in starts])
+            
+            X_window = flatten_normalize(X_window, dtype)
+            Y_window = Y_window.reshape(1, -1).astype(dtype)
+            
+            permutation = list(rng.permutation(X_window.shape[1]))
+            X_window = np.concatenate((X_left, X_window[:, permutation]), axis=1)
+            Y_window = np.concatenate((Y_left, Y_window[:, permutation]), axis=1)
+            
+            num_complete = X_window.shape[1] // mini_batch_size
+            for i in range(num_complete):
+                yield (X_window[:, i * mini_batch_size : (i + 1) * mini_batch_size],
+                       Y_window[:, i * mini_batch_size : (i + 1) * mini_batch_size])
+            
+            X_left = X_window[:, num_complete * mini_batch_size:]
+            Y_left = Y_window[:, num_complete * mini_batch_size:]
+        
+        if X_left.shape[1] > 0:
+            yield X_left, Y_left
+
+def L_layer_model_h5(path, layers_dims, learning_rate = 0.0075, num_epochs = 3000, mini_batch_size = 64, print_cost = False,
+                     x_name="train_set_x", y_name="train_set_y", window_size = 1024, dtype=np.float64):
+    """
+    Mini-batch version of L_layer_model() that streams its training set from an HDF5 file with h5_mini_batches(),
+    so that peak memory depends on the batch and window sizes rather than on the number of examples.
+    
+    Arguments:
+    path -- path of the HDF5 training file
+    layers_dims -- list containing the input size and each layer size, of length (number of layers + 1).
+    learning_rate -- learning rate of the gradient descent update rule
+    num_epochs -- number of passes over the training set
+    mini_batch_size -- number of examples in each mini-batch
+    print_cost -- if True, it prints the cost every 100 epochs and after the last one
+    x_name, y_name -- names of the images and labels datasets in the file
+    window_size -- approximate number of examples held in memory at once, see h5_mini_batches()
+    dtype -- floating point type used for the parameters and the whole forward/backward computation
+    
+    Returns:
+    parameters -- parameters learnt by the model. They can then be used to predict.
+    costs -- list of the average cost over an epoch, every 100 epochs and for the last epoch
+    """
+    
+    np.random.seed(1)
+    costs = []                         # keep track of cost
+    
+    parameters = initialize_parameters_deep(layers_dims, dtype)
+    
+    for i in range(num_epochs):
+        cost_total = 0
+        m = 0
+        
+        for mini_batch_X, mini_batch_Y in h5_mini_batches(path, x_name, y_name, mini_batch_size, window_size, seed = i,
+                                                            dtype = dtype):
+            AL, caches = L_model_forward(mini_batch_X, parameters)
+            cost, dZL = sigmoid_cross_entropy(caches[-1][1], mini_batch_Y)
+            cost_total += cost * mini_batch_Y.shape[1]
+            grads = L_model_backward(AL, mini_batch_Y, caches, dZL = dZL)
+            parameters = update_parameters(parameters, grads, learning_rate)
+            m += mini_batch_Y.shape[1]
+        
+        cost = cost_total / m
+        
+        # Print the cost every 100 epochs
+        if print_cost and (i % 100 == 0 or i == num_epochs - 1):
+            print("Cost after epoch {}: {}".format(i, np.squeeze(cost)))
+        if i % 100 == 0 or i == num_epochs - 1:
+            costs.append(cost)
+    
+    return parameters, costs
+
+
 def initialize_parameters(n_x, n_h, n_y):
     """
     Argument:
@@ -136,10 +491,12 @@ def initialize_parameters(n_x, n_h, n_y):
     return parameters     
 
 
-def initialize_parameters_deep(layer_dims):
+def initialize_parameters_deep(layer_dims, dtype=np.float64):
     """
     Arguments:
     layer_dims -- python array (list) containing the dimensions of each layer in our network
+    dtype -- floating point type of the parameters; the values are drawn in float64 and rounded,
+             so every dtype starts from the same network
     
     Returns:
     parameters -- python dictionary containing your parameters "W1", "b1", ..., "WL", "bL":
@@ -152,8 +509,8 @@ def initialize_parameters_deep(layer_dims):
     L = len(layer_dims)            # number of layers in the network
 
     for l in range(1, L):
-        parameters['W' + str(l)] = np.random.randn(layer_dims[l], layer_dims[l-1]) / np.sqrt(layer_dims[l-1]) #*0.01
-        parameters['b' + str(l)] = np.zeros((layer_dims[l], 1))
+        parameters['W' + str(l)] = (np.random.randn(layer_dims[l], layer_dims[l-1]) / np.sqrt(layer_dims[l-1])).astype(dtype, copy=False) #*0.01
+        parameters['b' + str(l)] = np.zeros((layer_dims[l], 1), dtype=dtype)
         
         assert(parameters['W' + str(l)].shape == (layer_dims[l], layer_dims[l-1]))
         assert(parameters['b' + str(l)].shape == (layer_dims[l], 1))
@@ -161,7 +518,98 @@ def initialize_parameters_deep(layer_dims):
         
     return parameters
 
-def linear_forward(A, W, b):
+def _flat_layer_views(theta, layer_dims, prefix=""):
+    """
+    Slice a flat buffer into named per-layer views laid out as W1, b1, W2, b2, ..., WL, bL.
+    
+    Arguments:
+    theta -- 1-D numpy array of size flat_parameters_size(layer_dims)
+    layer_dims -- python array (list) containing the dimensions of each layer in our network
+    prefix -- string prepended to the names, "" for parameters and "d" for gradients
+    
+    Returns:
+    views -- python dictionary mapping prefix + "Wl" / prefix + "bl" to reshaped views of theta (no copies)
+    """
+    
+    views = {}
+    offset = 0
+    
+    for l in range(1, len(layer_dims)):
+        size = layer_dims[l] * layer_dims[l-1]
+        views[prefix + 'W' + str(l)] = theta[offset:offset + size].reshape(layer_dims[l], layer_dims[l-1])
+        offset += size
+        views[prefix + 'b' + str(l)] = theta[offset:offset + layer_dims[l]].reshape(layer_dims[l], 1)
+        offset += layer_dims[l]
+        
+    assert(offset == theta.shape[0])
+    
+    return views
+
+def flat_parameters_size(layer_dims):
+    """
+    Arguments:
+    layer_dims -- python array (list) containing the dimensions of each layer in our network
+    
+    Returns:
+    size -- total number of scalars in all the "Wl" and "bl" of the network
+    """
+    
+    return sum(layer_dims[l] * (layer_dims[l-1] + 1) for l in range(1, len(layer_dims)))
+
+def initialize_parameters_flat(layer_dims, dtype=np.float64):
+    """
+    Same initialization as initialize_parameters_deep(), but every "Wl" and "bl" is a view into one contiguous vector.
+    
+    The returned dictionary can be passed to L_model_forward() unchanged. Update it with update_parameters_flat()
+    (update_parameters() would rebind the keys to new arrays), and checkpoint or restore the whole model with
+    a single copy of theta: saved = theta.copy() / np.copyto(theta, saved).
+    
+    Arguments:
+    layer_dims -- python array (list) containing the dimensions of each layer in our network
+    dtype -- floating point type of theta
+    
+    Returns:
+    parameters -- python dictionary containing the views "W1", "b1", ..., "WL", "bL"
+    theta -- 1-D numpy array holding all the parameters, in the order W1, b1, W2, b2, ...
+    """
+    
+    np.random.seed(1)
+    theta = np.empty(flat_parameters_size(layer_dims), dtype=dtype)
+    parameters = _flat_layer_views(theta, layer_dims)
+    L = len(layer_dims)            # number of layers in the network
+
+    for l in range(1, L):
+        parameters['W' + str(l)][...] = np.random.randn(layer_dims[l], layer_dims[l-1]) / np.sqrt(layer_dims[l-1])
+        parameters['b' + str(l)][...] = 0
+        
+    return parameters, theta
+
+def cast_parameters(parameters, dtype, out=None):
+    """
+    Convert every array of a parameters (or grads) dictionary to another floating point type.
+    
+    Used for mixed precision training with float64 master weights: the float64 parameters are cast to
+    float32 for L_model_forward()/L_model_backward(), and update_parameters() applies the float32 gradients
+    to the float64 master copy (NumPy promotes "W - learning_rate * dW" to float64).
+    
+    Arguments:
+    parameters -- python dictionary of numpy arrays
+    dtype -- target floating point type
+    out -- optional dictionary with the same keys and shapes, of type dtype, to copy into instead of allocating
+    
+    Returns:
+    out -- python dictionary with the same keys, whose arrays are of type dtype
+    """
+    
+    if out is None:
+        return {key: value.astype(dtype) for key, value in parameters.items()}
+    
+    for key, value in parameters.items():
+        np.copyto(out[key], value, casting='same_kind')
+    
+    return out
+
+def linear_forward(A, W, b, out=None):
     """
     Implement the linear part of a layer's forward propagation.
 
@@ -169,20 +617,31 @@ def linear_forward(A, W, b):
     A -- activations from previous layer (or input data): (size of previous layer, number of examples)
     W -- weights matrix: numpy array of shape (size of current layer, size of previous layer)
     b -- bias vector, numpy array of shape (size of the current layer, 1)
+    out -- optional preallocated array of shape (size of the current layer, number of examples) to write Z into
 
     Returns:
     Z -- the input of the activation function, also called pre-activation parameter 
     cache -- a python dictionary containing "A", "W" and "b" ; stored for computing the backward pass efficiently
     """
     
-    Z = W.dot(A) + b
+    if _profile is not None:
+        start = time.perf_counter()
+    
+    if out is None:
+        Z = W.dot(A) + b
+    else:
+        Z = np.dot(W, A, out=out)
+        np.add(Z, b, out=Z)
     
     assert(Z.shape == (W.shape[0], A.shape[1]))
     cache = (A, W, b)
     
+    if _profile is not None:
+        _profile_phase("linear", start, 2 * W.size * A.shape[1] + Z.size, Z.nbytes if out is None else 0)
+    
     return Z, cache
 
-def linear_activation_forward(A_prev, W, b, activation):
+def linear_activation_forward(A_prev, W, b, activation, out=None):
     """
     Implement the forward propagation for the LINEAR->ACTIVATION layer
 
@@ -191,6 +650,7 @@ def linear_activation_forward(A_prev, W, b, activation):
     W -- weights matrix: numpy array of shape (size of current layer, size of previous layer)
     b -- bias vector, numpy array of shape (size of the current layer, 1)
     activation -- the activation to be used in this layer, stored as a text string: "sigmoid" or "relu"
+    out -- optional tuple of preallocated (Z, A) arrays to write the layer outputs into
 
     Returns:
     A -- the output of the activation function, also called the post-activation value 
@@ -198,15 +658,17 @@ def linear_activation_forward(A_prev, W, b, activation):
              stored for computing the backward pass efficiently
     """
     
+    Z_out, A_out = out if out is not None else (None, None)
+    
     if activation == "sigmoid":
         # Inputs: "A_prev, W, b". Outputs: "A, activation_cache".
-        Z, linear_cache = linear_forward(A_prev, W, b)
-        A, activation_cache = sigmoid(Z)
+        Z, linear_cache = linear_forward(A_prev, W, b, out=Z_out)
+        A, activation_cache = sigmoid(Z, out=A_out)
     
     elif activation == "relu":
         # Inputs: "A_prev, W, b". Outputs: "A, activation_cache".
-        Z, linear_cache = linear_forward(A_prev, W, b)
-        A, activation_cache = relu(Z)
+        Z, linear_cache = linear_forward(A_prev, W, b, out=Z_out)
+        A, activation_cache = relu(Z, out=A_out)
         
     else:
         print("\033[91mError! Please make sure you have passed the value correctly in the \"activation\" parameter")
@@ -216,13 +678,15 @@ def linear_activation_forward(A_prev, W, b, activation):
 
     return A, cache
 
-def L_model_forward(X, parameters):
+def L_model_forward(X, parameters, workspace=None):
     """
     Implement forward propagation for the [LINEAR->RELU]*(L-1)->LINEAR->SIGMOID computation
     
     Arguments:
     X -- data, numpy array of shape (input size, number of examples)
     parameters -- output of initialize_parameters_deep()
+    workspace -- optional output of initialize_workspace(); if given, Z and A of every layer
+                 are written into its buffers instead of freshly allocated arrays
     
     Returns:
     AL -- last post-activation value
@@ -238,11 +702,15 @@ def L_model_forward(X, parameters):
     # Implement [LINEAR -> RELU]*(L-1). Add "cache" to the "caches" list.
     for l in range(1, L):
         A_prev = A 
-        A, cache = linear_activation_forward(A_prev, parameters['W' + str(l)], parameters['b' + str(l)], activation = "relu")
+        _profile_layer(l)
+        A, cache = linear_activation_forward(A_prev, parameters['W' + str(l)], parameters['b' + str(l)], activation = "relu",
+                                             out = _workspace_forward_buffers(workspace, l))
         caches.append(cache)
     
     # Implement LINEAR -> SIGMOID. Add "cache" to the "caches" list.
-    AL, cache = linear_activation_forward(A, parameters['W' + str(L)], parameters['b' + str(L)], activation = "sigmoid")
+    _profile_layer(L)
+    AL, cache = linear_activation_forward(A, parameters['W' + str(L)], parameters['b' + str(L)], activation = "sigmoid",
+                                          out = _workspace_forward_buffers(workspace, L))
     caches.append(cache)
     
     assert(AL.shape == (1,X.shape[1]))
@@ -263,21 +731,59 @@ def compute_cost(AL, Y):
     
     m = Y.shape[1]
 
-    # Compute loss from aL and y.
-    cost = (1./m) * (-np.dot(Y,np.log(AL).T) - np.dot(1-Y, np.log(1-AL).T))
+    # Compute loss from aL and y. The logs are taken in the dtype of AL, the sums are accumulated in float64.
+    log_AL = np.log(AL).astype(np.float64, copy=False)
+    log_1_AL = np.log(1-AL).astype(np.float64, copy=False)
+    cost = (1./m) * (-np.dot(Y,log_AL.T) - np.dot(1-Y, log_1_AL.T))
     
     cost = np.squeeze(cost)      # To make sure your cost's shape is what we expect (e.g. this turns [[17]] into 17).
     assert(cost.shape == ())
     
     return cost
 
-def linear_backward(dZ, cache):
+def sigmoid_cross_entropy(ZL, Y):
+    """
+    Compute the cross-entropy cost of sigmoid(ZL) and its gradient with respect to ZL in one pass,
+    working on ZL directly so that neither log(AL) nor log(1-AL) can overflow when AL saturates to 0 or 1.
+    
+    Uses the log-sum-exp forms  -log(sigmoid(z)) = max(-z, 0) + log(1 + exp(-|z|))
+                                -log(1-sigmoid(z)) = max(z, 0) + log(1 + exp(-|z|))
+    and dZL = sigmoid(ZL) - Y, evaluated from the same exp(-|z|).
+
+    Arguments:
+    ZL -- linear output of the last layer, shape (1, number of examples); it is caches[-1][1] after L_model_forward()
+    Y -- true "label" vector (for example: containing 0 if non-cat, 1 if cat), shape (1, number of examples)
+
+    Returns:
+    cost -- cross-entropy cost, same value as compute_cost(sigmoid(ZL), Y) wherever the latter is finite
+    dZL -- Gradient of the cost with respect to ZL (without the 1/m factor, as expected by L_model_backward()),
+           of the same dtype as ZL
+    """
+    
+    m = Y.shape[1]
+    Y = Y.reshape(ZL.shape).astype(ZL.dtype, copy=False)
+    
+    E = np.exp(-np.abs(ZL))
+    
+    # max(z, 0) - z*y + log(1 + exp(-|z|)) is y * -log(s) + (1-y) * -log(1-s), summed in float64
+    cost = (1./m) * np.sum(np.maximum(ZL, 0) - ZL * Y + np.log1p(E), dtype=np.float64)
+    
+    # sigmoid(z) = 1/(1+e) for z >= 0 and e/(1+e) for z < 0, with e = exp(-|z|) <= 1
+    dZL = np.where(ZL >= 0, 1, E) / (1 + E) - Y
+    
+    cost = np.squeeze(cost)
+    assert(cost.shape == ())
+    
+    return cost, dZL
+
+def linear_backward(dZ, cache, out=None):
     """
     Implement the linear portion of backward propagation for a single layer (layer l)
 
     Arguments:
     dZ -- Gradient of the cost with respect to the linear output (of current layer l)
     cache -- tuple of values (A_prev, W, b) coming from the forward propagation in the current layer
+    out -- optional tuple of preallocated (dA_prev, dW, db) arrays to write the gradients into
 
     Returns:
     dA_prev -- Gradient of the cost with respect to the activation (of the previous layer l-1), same shape as A_prev
@@ -286,18 +792,33 @@ def linear_backward(dZ, cache):
     """
     A_prev, W, b = cache
     m = A_prev.shape[1]
+    
+    if _profile is not None:
+        start = time.perf_counter()
 
-    dW = 1./m * np.dot(dZ,A_prev.T)
-    db = 1./m * np.sum(dZ, axis = 1, keepdims = True)
-    dA_prev = np.dot(W.T,dZ)
+    if out is None:
+        dW = 1./m * np.dot(dZ,A_prev.T)
+        db = 1./m * np.sum(dZ, axis = 1, keepdims = True)
+        dA_prev = np.dot(W.T,dZ)
+    else:
+        dA_prev, dW, db = out
+        np.dot(dZ, A_prev.T, out=dW)
+        np.multiply(dW, 1./m, out=dW)
+        np.sum(dZ, axis = 1, keepdims = True, out=db)
+        np.multiply(db, 1./m, out=db)
+        np.dot(W.T, dZ, out=dA_prev)
     
     assert (dA_prev.shape == A_prev.shape)
     assert (dW.shape == W.shape)
     assert (db.shape == b.shape)
     
+    if _profile is not None:
+        _profile_phase("linear_backward", start, 4 * W.size * m + dZ.size + W.size,
+                       dA_prev.nbytes + dW.nbytes + db.nbytes if out is None else 0)
+    
     return dA_prev, dW, db
 
-def linear_activation_backward(dA, cache, activation):
+def linear_activation_backward(dA, cache, activation, out=None):
     """
     Implement the backward propagation for the LINEAR->ACTIVATION layer.
     
@@ -305,6 +826,8 @@ def linear_activation_backward(dA, cache, activation):
     dA -- post-activation gradient for current layer l 
     cache -- tuple of values (linear_cache, activation_cache) we store for computing backward propagation efficiently
     activation -- the activation to be used in this layer, stored as a text string: "sigmoid" or "relu"
+    out -- optional tuple of preallocated (dZ, dA_prev, dW, db) arrays to write the gradients into;
+           only supported for "relu" (see L_model_backward for the in-place sigmoid output layer)
     
     Returns:
     dA_prev -- Gradient of the cost with respect to the activation (of the previous layer l-1), same shape as A_prev
@@ -313,7 +836,11 @@ def linear_activation_backward(dA, cache, activation):
     """
     linear_cache, activation_cache = cache
     
-    if activation == "relu":
+    if activation == "relu" and out is not None:
+        dZ = relu_backward(dA, activation_cache, out=out[0])
+        dA_prev, dW, db = linear_backward(dZ, linear_cache, out=out[1:])
+        
+    elif activation == "relu":
         dZ = relu_backward(dA, activation_cache)
         dA_prev, dW, db = linear_backward(dZ, linear_cache)
         
@@ -326,7 +853,7 @@ def linear_activation_backward(dA, cache, activation):
     
     return dA_prev, dW, db
 
-def L_model_backward(AL, Y, caches):
+def L_model_backward(AL, Y, caches, workspace=None, dZL=None):
     """
     Implement the backward propagation for the [LINEAR->RELU] * (L-1) -> LINEAR -> SIGMOID group
     
@@ -336,6 +863,10 @@ def L_model_backward(AL, Y, caches):
     caches -- list of caches containing:
                 every cache of linear_activation_forward() with "relu" (there are (L-1) or them, indexes from 0 to L-2)
                 the cache of linear_activation_forward() with "sigmoid" (there is one, index L-1)
+    workspace -- optional output of initialize_workspace(), the same one passed to L_model_forward();
+                 if given, every gradient is written into its buffers instead of freshly allocated arrays
+    dZL -- optional gradient of the cost with respect to ZL, output of sigmoid_cross_entropy(); if given,
+           the backward pass starts from it instead of recomputing dAL and the sigmoid derivative from AL
     
     Returns:
     grads -- A dictionary with the gradients
@@ -345,19 +876,28 @@ def L_model_backward(AL, Y, caches):
     """
     grads = {}
     L = len(caches) # the number of layers
-    m = AL.shape[1]
-    Y = Y.reshape(AL.shape) # after this line, Y is the same shape as AL
+    Y = Y.reshape(AL.shape).astype(AL.dtype, copy=False) # after this line, Y is the same shape and dtype as AL
     
-    # Initializing the backpropagation
-    dAL = - (np.divide(Y, AL) - np.divide(1 - Y, 1 - AL))
+    if workspace is not None:
+        return _L_model_backward_in_place(AL, Y, caches, workspace, dZL)
     
-    # Lth layer (SIGMOID -> LINEAR) gradients. Inputs: "AL, Y, caches". Outputs: "grads["dAL"], grads["dWL"], grads["dbL"]
     current_cache = caches[L-1]
-    grads["dA" + str(L-1)], grads["dW" + str(L)], grads["db" + str(L)] = linear_activation_backward(dAL, current_cache, activation = "sigmoid")
+    _profile_layer(L)
+    
+    if dZL is not None:
+        # The fused kernel already gives the gradient at the sigmoid input
+        grads["dA" + str(L-1)], grads["dW" + str(L)], grads["db" + str(L)] = linear_backward(dZL, current_cache[0])
+    else:
+        # Initializing the backpropagation
+        dAL = - (np.divide(Y, AL) - np.divide(1 - Y, 1 - AL))
+        
+        # Lth layer (SIGMOID -> LINEAR) gradients. Inputs: "AL, Y, caches". Outputs: "grads["dAL"], grads["dWL"], grads["dbL"]
+        grads["dA" + str(L-1)], grads["dW" + str(L)], grads["db" + str(L)] = linear_activation_backward(dAL, current_cache, activation = "sigmoid")
     
     for l in reversed(range(L-1)):
         # lth layer: (RELU -> LINEAR) gradients.
         current_cache = caches[l]
+        _profile_layer(l + 1)
         dA_prev_temp, dW_temp, db_temp = linear_activation_backward(grads["dA" + str(l + 1)], current_cache, activation = "relu")
         grads["dA" + str(l)] = dA_prev_temp
         grads["dW" + str(l + 1)] = dW_temp
@@ -365,6 +905,184 @@ def L_model_backward(AL, Y, caches):
 
     return grads
 
+def L_model_forward_checkpointed(X, parameters, checkpoint_every):
+    """
+    Forward propagation for [LINEAR->RELU]*(L-1)->LINEAR->SIGMOID that keeps only the activations entering
+    every checkpoint_every-th layer instead of the caches of all the layers. The missing caches are recomputed,
+    one segment at a time, by L_model_backward_checkpointed().
+    
+    Memory held between the passes drops from about L activations to L / checkpoint_every, plus one segment
+    during the backward pass, at the price of running the forward pass of every segment twice.
+    
+    Arguments:
+    X -- data, numpy array of shape (input size, number of examples)
+    parameters -- output of initialize_parameters_deep()
+    checkpoint_every -- number of layers per recomputed segment; 1 keeps every layer's input
+    
+    Returns:
+    AL -- last post-activation value, identical to the one of L_model_forward()
+    checkpoints -- python dictionary mapping the index l of the first layer of each segment, minus one,
+                   to the activation A_l entering it (checkpoints[0] is X)
+    """
+    
+    checkpoints = {0: X}
+    A = X
+    L = len(parameters) // 2                  # number of layers in the neural network
+    
+    for l in range(1, L + 1):
+        activation = "sigmoid" if l == L else "relu"
+        _profile_layer(l)
+        A, cache = linear_activation_forward(A, parameters['W' + str(l)], parameters['b' + str(l)], activation = activation)
+        if l % checkpoint_every == 0 and l < L:
+            checkpoints[l] = A
+    
+    assert(A.shape == (1,X.shape[1]))
+    
+    return A, checkpoints
+
+def L_model_backward_checkpointed(AL, Y, checkpoints, parameters, keep_dA=False):
+    """
+    Backward propagation matching L_model_forward_checkpointed(): the segments are processed from the last
+    to the first, each one rebuilding its caches from its checkpoint with the same forward operations and then
+    back-propagating through them. The gradients are bit-identical to those of L_model_backward().
+    
+    Arguments:
+    AL -- probability vector, output of L_model_forward_checkpointed()
+    Y -- true "label" vector (containing 0 if non-cat, 1 if cat)
+    checkpoints -- output of L_model_forward_checkpointed()
+    parameters -- the parameters used in the forward pass
+    keep_dA -- if True, also return every grads["dA" + str(l)]; by default each one is dropped as soon as the
+               layer below has consumed it, so that at most one activation gradient is alive at a time
+    
+    Returns:
+    grads -- A dictionary with the "dW" and "db" gradients of L_model_backward(), and its "dA" ones if keep_dA
+    """
+    grads = {}
+    L = len(parameters) // 2 # the number of layers
+    Y = Y.reshape(AL.shape).astype(AL.dtype, copy=False) # after this line, Y is the same shape and dtype as AL
+    
+    starts = sorted(checkpoints.keys())
+    ends = starts[1:] + [L]
+    
+    for start, end in reversed(list(zip(starts, ends))):
+        # Recompute the caches of layers start+1, ..., end
+        A = checkpoints[start]
+        segment_caches = []
+        for l in range(start + 1, end + 1):
+            activation = "sigmoid" if l == L else "relu"
+            _profile_layer(l)
+            A, cache = linear_activation_forward(A, parameters['W' + str(l)], parameters['b' + str(l)], activation = activation)
+            segment_caches.append(cache)
+        
+        for l in reversed(range(start + 1, end + 1)):
+            current_cache = segment_caches.pop()
+            _profile_layer(l)
+            if l == L:
+                # Initializing the backpropagation
+                dAL = - (np.divide(Y, AL) - np.divide(1 - Y, 1 - AL))
+                dA_prev, grads["dW" + str(L)], grads["db" + str(L)] = linear_activation_backward(dAL, current_cache, activation = "sigmoid")
+            else:
+                dA_prev, grads["dW" + str(l)], grads["db" + str(l)] = linear_activation_backward(dA, current_cache, activation = "relu")
+            # Rebinding dA releases the previous activation gradient unless the caller asked to keep it
+            dA = dA_prev
+            if keep_dA:
+                grads["dA" + str(l-1)] = dA
+    
+    return grads
+
+def initialize_workspace(layer_dims, m, dtype=np.float64):
+    """
+    Preallocate every per-layer buffer used by L_model_forward() and L_model_backward(),
+    so that a training loop running on batches of a fixed size allocates no new arrays after the first iteration.
+    
+    Arguments:
+    layer_dims -- python array (list) containing the dimensions of each layer in our network
+    m -- number of examples in every batch that will be passed through the workspace
+    dtype -- floating point type of the buffers, the same as the parameters and X
+    
+    Returns:
+    workspace -- python dictionary containing the buffers:
+                    Zl, Al, dZl -- arrays of shape (layer_dims[l], m)
+                    dA(l-1) -- array of shape (layer_dims[l-1], m)
+                    dWl -- array of shape (layer_dims[l], layer_dims[l-1])
+                    dbl -- array of shape (layer_dims[l], 1)
+                    dAL, tmp -- arrays of shape (layer_dims[L], m) used to seed the backward pass
+                    dtheta -- 1-D array holding every "dWl" and "dbl", laid out like the theta of initialize_parameters_flat()
+    """
+    
+    workspace = {}
+    L = len(layer_dims) - 1        # number of layers with parameters
+    
+    workspace['dtheta'] = np.empty(flat_parameters_size(layer_dims), dtype=dtype)
+    workspace.update(_flat_layer_views(workspace['dtheta'], layer_dims, prefix="d"))
+    
+    for l in range(1, L + 1):
+        workspace['Z' + str(l)] = np.empty((layer_dims[l], m), dtype=dtype)
+        workspace['A' + str(l)] = np.empty((layer_dims[l], m), dtype=dtype)
+        workspace['dZ' + str(l)] = np.empty((layer_dims[l], m), dtype=dtype)
+        workspace['dA' + str(l-1)] = np.empty((layer_dims[l-1], m), dtype=dtype)
+    
+    workspace['dA' + str(L)] = np.empty((layer_dims[L], m), dtype=dtype)
+    workspace['tmp'] = np.empty((layer_dims[L], m), dtype=dtype)
+    
+    return workspace
+
+def _workspace_forward_buffers(workspace, l):
+    """
+    Return the (Z, A) buffers of layer l, or None when running without a workspace.
+    """
+    if workspace is None:
+        return None
+    return workspace['Z' + str(l)], workspace['A' + str(l)]
+
+def _L_model_backward_in_place(AL, Y, caches, workspace, dZL=None):
+    """
+    Workspace version of L_model_backward(): same operations in the same order, written into preallocated buffers.
+    
+    Arguments:
+    AL -- probability vector, output of L_model_forward() run with the same workspace
+    Y -- true "label" vector, already reshaped to AL.shape and cast to its dtype
+    caches -- list of caches from L_model_forward()
+    workspace -- output of initialize_workspace()
+    dZL -- optional gradient with respect to ZL from sigmoid_cross_entropy(), used instead of seeding from AL
+    
+    Returns:
+    grads -- A dictionary with the gradients, whose arrays are views of the workspace buffers
+    """
+    grads = {}
+    L = len(caches)
+    
+    if dZL is None:
+        dAL = workspace['dA' + str(L)]
+        dZL = workspace['dZ' + str(L)]
+        tmp = workspace['tmp']
+        
+        # dAL = - (Y/AL - (1-Y)/(1-AL)), using dZL as scratch before it is needed
+        np.subtract(1, Y, out=dZL)
+        np.subtract(1, AL, out=tmp)
+        np.divide(dZL, tmp, out=tmp)
+        np.divide(Y, AL, out=dAL)
+        np.subtract(dAL, tmp, out=dAL)
+        np.negative(dAL, out=dAL)
+        
+        # Sigmoid backward: dZL = dAL * s * (1-s), where s = sigmoid(ZL) is exactly AL
+        np.subtract(1, AL, out=tmp)
+        np.multiply(dAL, AL, out=dZL)
+        np.multiply(dZL, tmp, out=dZL)
+    
+    linear_cache, activation_cache = caches[L-1]
+    _profile_layer(L)
+    grads["dA" + str(L-1)], grads["dW" + str(L)], grads["db" + str(L)] = linear_backward(
+        dZL, linear_cache, out=(workspace['dA' + str(L-1)], workspace['dW' + str(L)], workspace['db' + str(L)]))
+    
+    for l in reversed(range(L-1)):
+        out = (workspace['dZ' + str(l + 1)], workspace['dA' + str(l)], workspace['dW' + str(l + 1)], workspace['db' + str(l + 1)])
+        _profile_layer(l + 1)
+        grads["dA" + str(l)], grads["dW" + str(l + 1)], grads["db" + str(l + 1)] = linear_activation_backward(
+            grads["dA" + str(l + 1)], caches[l], activation = "relu", out = out)
+    
+    return grads
+
 def update_parameters(parameters, grads, learning_rate):
     """
     Update parameters using gradient descent
@@ -388,6 +1106,115 @@ def update_parameters(parameters, grads, learning_rate):
         
     return parameters
 
+def update_parameters_flat(theta, dtheta, learning_rate):
+    """
+    Update all the parameters at once, in place: theta = theta - learning_rate * dtheta, with a single BLAS axpy
+    when theta and dtheta are contiguous arrays of the same floating point type
+    
+    Arguments:
+    theta -- flat parameter vector, output of initialize_parameters_flat()
+    dtheta -- flat gradient vector with the same layout, e.g. workspace["dtheta"] after L_model_backward()
+    learning_rate -- learning rate of the gradient descent update rule
+    
+    Returns:
+    theta -- the same array, updated in place (the "Wl"/"bl" views of parameters see the new values)
+    """
+    if (theta.dtype == dtheta.dtype and theta.dtype in (np.float32, np.float64)
+            and theta.flags.c_contiguous and dtheta.flags.c_contiguous):
+        from scipy.linalg import get_blas_funcs
+        
+        axpy = get_blas_funcs('axpy', (theta, dtheta))
+        # BLAS overwrites y when it is contiguous and already of the routine's type
+        axpy(dtheta, theta, a=-learning_rate)
+    else:
+        # axpy would upcast into a new array here and leave theta, and the views into it, unchanged
+        np.subtract(theta, learning_rate * dtheta, out=theta, casting="same_kind")
+    
+    return theta
+
+_CHECKPOINT_MAGIC = b"DLCKPT01"
+_CHECKPOINT_ALIGNMENT = 64
+
+def save_checkpoint(parameters, path):
+    """
+    Save a parameters dictionary as a binary checkpoint: the magic bytes, the length of a JSON header
+    (names, shapes, dtypes and offsets of the arrays), the header, then the raw arrays, each one starting
+    at a multiple of 64 bytes. The file is written under a unique temporary name and renamed, so a reader
+    never sees a partial checkpoint.
+    
+    Arguments:
+    parameters -- python dictionary of numpy arrays (or scalars), e.g. the output of a model() function
+    path -- path of the checkpoint file
+    """
+    
+    arrays = [(name, np.asarray(value)) for name, value in parameters.items()]
+    # Only plain numeric arrays can be written as raw bytes; check them all before creating any file
+    for name, array in arrays:
+        if array.dtype.kind not in "biufc":
+            raise TypeError("cannot checkpoint {!r}: unsupported dtype {}".format(name, array.dtype))
+    
+    entries = []
+    offset = 0
+    for name, array in arrays:
+        entries.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+        offset += -(-array.nbytes // _CHECKPOINT_ALIGNMENT) * _CHECKPOINT_ALIGNMENT
+    header = json.dumps({"alignment": _CHECKPOINT_ALIGNMENT, "tensors": entries}).encode()
+    
+    # The arrays start at the first aligned offset after the header; the entries' offsets are relative to it
+    start = -(-(len(_CHECKPOINT_MAGIC) + 8 + len(header)) // _CHECKPOINT_ALIGNMENT) * _CHECKPOINT_ALIGNMENT
+    
+    # A unique temporary file in the target directory, so concurrent writers never share it and the
+    # final os.replace() stays on one filesystem
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_CHECKPOINT_MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for entry, (name, array) in zip(entries, arrays):
+                f.seek(start + entry["offset"])
+                f.write(array.tobytes())
+            f.truncate(start + offset)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def load_checkpoint(path, mode = "r"):
+    """
+    Load a checkpoint written by save_checkpoint() without reading it: the file is memory-mapped once and
+    every array is a view into the mapping, so loading is immediate, pages are read on first use, and
+    processes loading the same checkpoint share its pages.
+    
+    Arguments:
+    path -- path of the checkpoint file
+    mode -- "r" for read-only arrays, or "c" for copy-on-write arrays that can be updated in memory
+            without changing the file
+    
+    Returns:
+    parameters -- python dictionary of the arrays, in the order they were saved
+    """
+    
+    with open(path, "rb") as f:
+        if f.read(len(_CHECKPOINT_MAGIC)) != _CHECKPOINT_MAGIC:
+            raise ValueError(path + " is not a checkpoint written by save_checkpoint()")
+        header_length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_length).decode())
+    
+    alignment = header["alignment"]
+    start = -(-(len(_CHECKPOINT_MAGIC) + 8 + header_length) // alignment) * alignment
+    # Plain ndarray views of the mapping, which stays open as long as one of them is referenced
+    data = np.memmap(path, dtype=np.uint8, mode=mode).view(np.ndarray)
+    
+    parameters = {}
+    for entry in header["tensors"]:
+        dtype = np.dtype(entry["dtype"])
+        size = int(np.prod(entry["shape"])) * dtype.itemsize
+        offset = start + entry["offset"]
+        parameters[entry["name"]] = data[offset:offset + size].view(dtype).reshape(tuple(entry["shape"]))
+    
+    return parameters
+
 def predict(X, y, parameters):
     """
     This function is used to predict the results of a  L-layer neural network.
@@ -401,19 +1228,9 @@ def predict(X, y, parameters):
     """
     
     m = X.shape[1]
-    n = len(parameters) // 2 # number of layers in the neural network
-    p = np.zeros((1,m))
-    
-    # Forward propagation
-    probas, caches = L_model_forward(X, parameters)
-
     
-    # convert probas to 0/1 predictions
-    for i in range(0, probas.shape[1]):
-        if probas[0,i] > 0.5:
-            p[0,i] = 1
-        else:
-            p[0,i] = 0
+    # Forward propagation without caches, converted to 0/1 predictions
+    p = predict_batch(X, parameters)
     
     #print results
     #print ("predictions: " + str(p))
@@ -422,6 +1239,70 @@ def predict(X, y, parameters):
         
     return p
 
+def L_model_forward_inference(X, parameters):
+    """
+    Forward propagation for [LINEAR->RELU]*(L-1)->LINEAR->SIGMOID without building any cache,
+    reusing each layer's Z array for its activation. Gives the same AL as L_model_forward().
+    
+    Arguments:
+    X -- data, numpy array of shape (input size, number of examples)
+    parameters -- output of initialize_parameters_deep()
+    
+    Returns:
+    AL -- last post-activation value, of shape (1, number of examples)
+    """
+    
+    A = X
+    L = len(parameters) // 2                  # number of layers in the neural network
+    
+    for l in range(1, L):
+        Z = np.dot(parameters['W' + str(l)], A)
+        np.add(Z, parameters['b' + str(l)], out=Z)
+        A = np.maximum(0, Z, out=Z)
+    
+    Z = np.dot(parameters['W' + str(L)], A)
+    np.add(Z, parameters['b' + str(L)], out=Z)
+    _profile_layer(L)
+    AL, _ = sigmoid(Z, out=Z)
+    
+    return AL
+
+def predict_batch(X, parameters, chunk_size = 4096, n_jobs = 1):
+    """
+    Inference-only prediction of a L-layer neural network over an arbitrarily large X.
+    
+    X is processed chunk_size columns at a time, so memory is bounded by the chunk rather than by X,
+    and the chunks can be scored concurrently by n_jobs threads (NumPy releases the GIL inside BLAS).
+    
+    Arguments:
+    X -- data set of examples you would like to label, of shape (input size, number of examples);
+         a np.memmap works, only the chunks being scored are read
+    parameters -- parameters of the trained model
+    chunk_size -- number of examples scored per forward pass
+    n_jobs -- number of threads scoring chunks in parallel, 1 to run in the calling thread
+    
+    Returns:
+    p -- 0/1 predictions for the given dataset X, of shape (1, number of examples)
+    """
+    
+    m = X.shape[1]
+    p = np.empty((1, m))
+    
+    def score_chunk(start):
+        end = min(start + chunk_size, m)
+        probas = L_model_forward_inference(X[:, start:end], parameters)
+        p[:, start:end] = probas > 0.5
+    
+    starts = range(0, m, chunk_size)
+    if n_jobs == 1:
+        for start in starts:
+            score_chunk(start)
+    else:
+        with ThreadPoolExecutor(max_workers = n_jobs) as executor:
+            list(executor.map(score_chunk, starts))
+    
+    return p
+
 def print_mislabeled_images(classes, X, y, p):
     """
     Plots images where predictions and truth were different.
@@ -429,6 +1310,7 @@ def print_mislabeled_images(classes, X, y, p):
     y -- true labels
     p -- predictions
     """
+    import matplotlib.pyplot as plt
     a = p + y
     mislabeled_indices = np.asarray(np.where(a == 1))
     plt.rcParams['figure.figsize'] = (40.0, 40.0) # set default size of plots
@@ -440,3 +1322,587 @@ def print_mislabeled_images(classes, X, y, p):
         plt.imshow(X[:,index].reshape(64,64,3), interpolation='nearest')
         plt.axis('off')
         plt.title("Prediction: " + classes[int(p[0,index])].decode("utf-8") + " \n Class: " + classes[y[0,index]].decode("utf-8"))
+
+
+def benchmark_dtype(X, Y, layers_dims, learning_rate = 0.0075, num_iterations = 50):
+    """
+    Time full training iterations (forward, cost, backward, update) of the L-layer model in
+    float64, in float32, and in float32 with float64 master weights, and print the per-iteration times next to
+    the cost reached, so that a speedup bought with a diverging cost is visible.
+    
+    Arguments:
+    X -- input data, of shape (n_x, number of examples), e.g. the flattened cat/non-cat training set
+    Y -- true "label" vector, of shape (1, number of examples)
+    layers_dims -- list containing the input size and each layer size
+    learning_rate -- learning rate of the gradient descent update rule
+    num_iterations -- number of timed iterations per mode
+    
+    Returns:
+    timings -- python dictionary mapping each mode to its mean time per iteration, in seconds
+    """
+    
+    timings = {}
+    costs = {}
+    
+    for mode in ["float64", "float32", "float32 + float64 master"]:
+        dtype = np.float64 if mode == "float64" else np.float32
+        X_mode = X.astype(dtype)
+        Y_mode = Y.astype(dtype)
+        master = initialize_parameters_deep(layers_dims)
+        parameters = cast_parameters(master, dtype)
+        
+        start = time.perf_counter()
+        for i in range(num_iterations):
+            AL, caches = L_model_forward(X_mode, parameters)
+            cost = compute_cost(AL, Y_mode)
+            grads = L_model_backward(AL, Y_mode, caches)
+            if mode == "float32 + float64 master":
+                master = update_parameters(master, grads, learning_rate)
+                parameters = cast_parameters(master, dtype, out=parameters)
+            else:
+                parameters = update_parameters(parameters, grads, learning_rate)
+        timings[mode] = (time.perf_counter() - start) / num_iterations
+        costs[mode] = float(cost)
+    
+    for mode, seconds in timings.items():
+        print("{:<26} {:8.2f} ms/iteration   speedup x{:.2f}   final cost {:.6f}".format(mode, 1000 * seconds, timings["float64"] / seconds, costs[mode]))
+    
+    return timings
+
+def quantize_parameters(parameters, X_calib, percentile = 100.0):
+    """
+    Post-training int8 quantization of the parameters of a trained L-layer model.
+    
+    The weights are quantized symmetrically with one scale per output unit (row of W). The input of each
+    layer gets a single scale, calibrated on the activations the float model produces from X_calib.
+    
+    Arguments:
+    parameters -- parameters of the trained model
+    X_calib -- calibration sample of the data, of shape (input size, number of examples)
+    percentile -- percentile of the absolute activations mapped to 127; below 100, outliers are clipped
+    
+    Returns:
+    qparams -- python dictionary containing, for each layer l:
+                    Wl -- int8 weight matrix of shape (layer_dims[l], layer_dims[l-1])
+                    swl -- float32 weight scales of shape (layer_dims[l], 1)
+                    bl -- float32 bias vector of shape (layer_dims[l], 1)
+                    sxl -- float32 scale of the layer input
+    """
+    
+    qparams = {}
+    A = X_calib
+    L = len(parameters) // 2                  # number of layers in the neural network
+    
+    for l in range(1, L + 1):
+        W = parameters['W' + str(l)]
+        b = parameters['b' + str(l)]
+        
+        sx = np.percentile(np.abs(A), percentile) / 127
+        sw = np.max(np.abs(W), axis=1, keepdims=True) / 127
+        sw[sw == 0] = 1
+        
+        qparams['W' + str(l)] = np.rint(W / sw).astype(np.int8)
+        qparams['sw' + str(l)] = sw.astype(np.float32)
+        qparams['b' + str(l)] = b.astype(np.float32)
+        qparams['sx' + str(l)] = np.float32(sx if sx > 0 else 1)
+        
+        A = np.maximum(0, np.dot(W, A) + b)
+    
+    return qparams
+
+def _int8_matmul(W_q, A_q, block = 1024):
+    """
+    Product of an int8 weight matrix and int8-valued activations, accumulated exactly as with int32.
+    
+    NumPy has no int8 GEMM, so the product runs through float32 BLAS in blocks of the inner dimension:
+    a block sums at most 127 * 127 * 1024 < 2**24 integers, which float32 represents exactly, and the blocks
+    are added up in float64.
+    
+    Arguments:
+    W_q -- int8 weight matrix of shape (n_l, n_prev)
+    A_q -- int8 activations, or float32 array of int8 values, of shape (n_prev, number of examples)
+    block -- number of inner-dimension entries per float32 product, at most 1040
+    
+    Returns:
+    acc -- float64 array of the exact integer products, of shape (n_l, number of examples)
+    """
+    
+    acc = None
+    for k in range(0, W_q.shape[1], block):
+        partial = np.dot(W_q[:, k:k + block].astype(np.float32), A_q[k:k + block].astype(np.float32, copy=False))
+        acc = partial.astype(np.float64) if acc is None else np.add(acc, partial, out=acc)
+    
+    return acc
+
+def _quantize(A, sx):
+    """
+    Quantize A with the scale sx, returning a float32 array of int8 values (one float32 pass, then in place).
+    """
+    A_q = np.multiply(A, 1 / sx, dtype=np.float32)
+    np.rint(A_q, out=A_q)
+    np.clip(A_q, -127, 127, out=A_q)
+    return A_q
+
+def quantize_input(X, qparams):
+    """
+    Quantize the data to int8 ahead of L_model_forward_int8(), e.g. once when the data is loaded, so that
+    the forward pass skips the quantization of its largest input and reads 8 times fewer bytes.
+    
+    Arguments:
+    X -- data, numpy array of shape (input size, number of examples)
+    qparams -- output of quantize_parameters()
+    
+    Returns:
+    X_q -- int8 array of the same shape as X
+    """
+    return _quantize(X, qparams['sx1']).astype(np.int8)
+
+def L_model_forward_int8(X, qparams):
+    """
+    Forward propagation for [LINEAR->RELU]*(L-1)->LINEAR->SIGMOID with the int8 parameters of
+    quantize_parameters(): each layer quantizes its input to int8, multiplies it by the int8 weights with
+    integer accumulation, and dequantizes the result in a float epilogue adding the bias and applying
+    the relu or the sigmoid.
+    
+    Arguments:
+    X -- data, numpy array of shape (input size, number of examples), or its int8 quantize_input()
+    qparams -- output of quantize_parameters()
+    
+    Returns:
+    AL -- last post-activation value, of shape (1, number of examples)
+    """
+    
+    A = X
+    L = len(qparams) // 4                     # number of layers in the neural network
+    
+    for l in range(1, L + 1):
+        sx = qparams['sx' + str(l)]
+        A_q = A if A.dtype == np.int8 else _quantize(A, sx)
+        
+        Z = _int8_matmul(qparams['W' + str(l)], A_q)
+        np.multiply(Z, qparams['sw' + str(l)] * sx, out=Z)
+        np.add(Z, qparams['b' + str(l)], out=Z)
+        if l < L:
+            A = np.maximum(0, Z, out=Z)
+    
+    AL, _ = sigmoid(Z, out=Z)
+    
+    return AL
+
+def quantization_report(X, Y, parameters, qparams, n_repeats = 10):
+    """
+    Compare the int8 forward pass with the float one on a data set, e.g. the test set, and print the
+    accuracies, the agreement of the predictions, the throughputs and the weight sizes. The int8 path is
+    timed both from the float data and from the data quantized beforehand by quantize_input().
+    
+    Arguments:
+    X -- data set, of shape (input size, number of examples)
+    Y -- true "label" vector, of shape (1, number of examples)
+    parameters -- parameters of the trained model
+    qparams -- output of quantize_parameters(parameters, ...)
+    n_repeats -- number of timed forward passes per path, the fastest one is kept
+    
+    Returns:
+    report -- python dictionary with the accuracy, the throughput (examples per second) and the weight
+              bytes of each path, the agreement of the float and int8 predictions and the largest
+              difference of their AL
+    """
+    
+    report = {}
+    outputs = {}
+    X_q = quantize_input(X, qparams)
+    
+    for path, forward, data, params in [("float", L_model_forward_inference, X, parameters),
+                                        ("int8", L_model_forward_int8, X, qparams),
+                                        ("int8_input", L_model_forward_int8, X_q, qparams)]:
+        seconds = float("inf")
+        for i in range(n_repeats):
+            start = time.perf_counter()
+            outputs[path] = forward(data, params)
+            seconds = min(seconds, time.perf_counter() - start)
+        report[path + "_accuracy"] = float(np.mean((outputs[path] > 0.5) == Y))
+        report[path + "_examples_per_second"] = X.shape[1] / seconds
+        report[path + "_weight_bytes"] = sum(params[key].nbytes for key in params if key.startswith('W'))
+    
+    report["agreement"] = float(np.mean((outputs["float"] > 0.5) == (outputs["int8"] > 0.5)))
+    report["max_abs_difference"] = float(np.max(np.abs(outputs["float"] - outputs["int8"])))
+    
+    for path in ["float", "int8", "int8_input"]:
+        print("{:<10} accuracy {:6.2%}   {:12.0f} examples/s   weights {:10d} bytes".format(
+            path, report[path + "_accuracy"], report[path + "_examples_per_second"], report[path + "_weight_bytes"]))
+    print("agreement {:.2%}   max |AL float - AL int8| {:.2e}   speedup x{:.2f} (x{:.2f} from int8 input)".format(
+        report["agreement"], report["max_abs_difference"],
+        report["int8_examples_per_second"] / report["float_examples_per_second"],
+        report["int8_input_examples_per_second"] / report["float_examples_per_second"]))
+    
+    return report
+
+def _shared_array(shape, dtype=np.float64, name=None):
+    """
+    Create (name=None) or attach to (name given) a block of shared memory viewed as a numpy array.
+    
+    Returns:
+    shm -- the SharedMemory object, to be closed (and unlinked by its creator) when done
+    array -- numpy array of the given shape and dtype backed by shm
+    """
+    size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    shm = shared_memory.SharedMemory(name=name, create=name is None, size=size if name is None else 0)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return shm, array
+
+_worker_state = {}
+
+def _init_gradient_worker(shapes, names, n_workers):
+    """
+    Pool initializer: attach the worker to the shared Y and per-layer Z, A, dA and dZ buffers.
+    """
+    for key in shapes:
+        _worker_state[key] = _shared_array(shapes[key], name=names[key])
+    _worker_state["n_workers"] = n_workers
+
+def _shard_activation(job):
+    """
+    Per-example part of one layer, on the columns of shard w: the activation A[l] from Z[l] going forward,
+    dZ[l] from dA[l] (or, for the output layer, from AL and Y) going backward. Every operation acts on each
+    column separately, with the same code as L_model_forward() and L_model_backward(), so the shard's columns
+    are exactly those of the full-batch arrays.
+    """
+    l, direction, w = job
+    L = len([key for key in _worker_state if key.startswith("dZ")])
+    
+    m = _worker_state["Y"][1].shape[1]
+    bounds = np.linspace(0, m, _worker_state["n_workers"] + 1).astype(int)
+    columns = slice(bounds[w], bounds[w + 1])
+    Z = _worker_state["Z" + str(l)][1][:, columns]
+    A = _worker_state["A" + str(l)][1][:, columns]
+    dZ = _worker_state["dZ" + str(l)][1][:, columns]
+    _profile_layer(l)
+    
+    if direction == "forward" and l == L:
+        A[...] = sigmoid(Z)[0]
+    elif direction == "forward":
+        A[...] = relu(Z)[0]
+    elif l == L:
+        Y = _worker_state["Y"][1][:, columns]
+        # Initializing the backpropagation
+        dAL = - (np.divide(Y, A) - np.divide(1 - Y, 1 - A))
+        dZ[...] = sigmoid_backward(dAL, Z)
+    else:
+        dZ[...] = relu_backward(_worker_state["dA" + str(l)][1][:, columns], Z)
+
+def L_layer_model_data_parallel(X, Y, layers_dims, learning_rate = 0.0075, num_iterations = 3000, print_cost=False, n_workers = 4):
+    """
+    Data-parallel version of L_layer_model(), with parameters and costs identical, bit for bit, to those of
+    L_layer_model() for any n_workers.
+    
+    Every layer's per-example work (activation, dAL, activation backward) is split into n_workers contiguous
+    shards of columns run by a pool of processes. The matrix products and the reductions over the examples
+    (Z = W.A + b, dW, db, dA_prev and the cost) are done by the parent on the full batch, with the same calls
+    as L_model_forward(), L_model_backward() and update_parameters(): BLAS does not round a block of columns
+    of a product the same way as the full product, so neither sharded products nor summed per-shard gradients
+    would reproduce the single-process results.
+    
+    X, Y, the flat parameters and every layer's Z, A, dA and dZ live in shared memory, so only layer and
+    shard indices go through the pool's pipes.
+    
+    Arguments:
+    X -- input data, of shape (n_x, number of examples)
+    Y -- true "label" vector (containing 1 if cat, 0 if non-cat), of shape (1, number of examples)
+    layers_dims -- list containing the input size and each layer size, of length (number of layers + 1).
+    learning_rate -- learning rate of the gradient descent update rule
+    num_iterations -- number of iterations of the optimization loop
+    print_cost -- if True, it prints the cost every 100 steps
+    n_workers -- number of worker processes, each taking one shard of the batch
+    
+    Returns:
+    parameters -- parameters learnt by the model. They can then be used to predict.
+    costs -- list of the cost every 100 iterations, and of the last iteration
+    """
+    
+    costs = []                         # keep track of cost
+    L = len(layers_dims) - 1
+    m = X.shape[1]
+    
+    initial_parameters, initial_theta = initialize_parameters_flat(layers_dims)
+    
+    shapes = {"X": X.shape, "Y": (1, m), "theta": initial_theta.shape}
+    for l in range(1, L + 1):
+        for key in ["Z", "A", "dA", "dZ"]:
+            shapes[key + str(l)] = (layers_dims[l], m)
+    shared = {key: _shared_array(shape) for key, shape in shapes.items()}
+    names = {key: shm.name for key, (shm, array) in shared.items()}
+    worker_keys = [key for key in shapes if key not in ("X", "theta")]
+    
+    try:
+        shared["X"][1][...] = X
+        shared["Y"][1][...] = Y.reshape(1, -1)
+        theta = shared["theta"][1]
+        theta[...] = initial_theta
+        parameters = _flat_layer_views(theta, layers_dims)
+        buffers = {key: array for key, (shm, array) in shared.items()}
+        buffers["A0"] = buffers["X"]
+        
+        with Pool(n_workers, initializer=_init_gradient_worker,
+                  initargs=({key: shapes[key] for key in worker_keys}, {key: names[key] for key in worker_keys}, n_workers)) as pool:
+            for i in range(0, num_iterations):
+                # Forward propagation: [LINEAR -> RELU]*(L-1) -> LINEAR -> SIGMOID.
+                for l in range(1, L + 1):
+                    _profile_layer(l)
+                    buffers["Z" + str(l)][...] = parameters["W" + str(l)].dot(buffers["A" + str(l-1)]) + parameters["b" + str(l)]
+                    pool.map(_shard_activation, [(l, "forward", w) for w in range(n_workers)])
+                
+                cost = compute_cost(buffers["A" + str(L)], buffers["Y"])
+                
+                # Backward propagation, with the gradients of all layers computed before any parameter changes
+                grads = {}
+                for l in reversed(range(1, L + 1)):
+                    pool.map(_shard_activation, [(l, "backward", w) for w in range(n_workers)])
+                    _profile_layer(l)
+                    dZ = buffers["dZ" + str(l)]
+                    grads["dW" + str(l)] = 1./m * np.dot(dZ, buffers["A" + str(l-1)].T)
+                    grads["db" + str(l)] = 1./m * np.sum(dZ, axis = 1, keepdims = True)
+                    if l > 1:
+                        buffers["dA" + str(l-1)][...] = np.dot(parameters["W" + str(l)].T, dZ)
+                
+                # Same update as update_parameters(), written into the shared views
+                for l in range(1, L + 1):
+                    for key in ["W" + str(l), "b" + str(l)]:
+                        np.subtract(parameters[key], learning_rate * grads["d" + key], out=parameters[key])
+                
+                # Print the cost every 100 iterations
+                if print_cost and (i % 100 == 0 or i == num_iterations - 1):
+                    print("Cost after iteration {}: {}".format(i, np.squeeze(cost)))
+                if i % 100 == 0 or i == num_iterations - 1:
+                    costs.append(cost)
+        
+        parameters = {key: value.copy() for key, value in parameters.items()}
+    
+    finally:
+        for shm, array in shared.values():
+            shm.close()
+            shm.unlink()
+    
+    return parameters, costs
+
+def sweep_search_space(space, n_samples = None, seed = 0):
+    """
+    Expand a search space into a list of hyperparameter configurations for hyperparameter_sweep().
+    
+    Arguments:
+    space -- python dictionary mapping each hyperparameter name ("layers_dims", "learning_rate", "model")
+             to the list of values to try
+    n_samples -- None for the full grid (every combination), or the number of configurations to draw at random
+    seed -- seed of the random search
+    
+    Returns:
+    configs -- list of python dictionaries, one value per hyperparameter
+    """
+    
+    names = sorted(space.keys())
+    
+    if n_samples is None:
+        configs = [{}]
+        for name in names:
+            configs = [dict(config, **{name: value}) for config in configs for value in space[name]]
+        return configs
+    
+    rng = np.random.RandomState(seed)
+    return [{name: space[name][rng.randint(len(space[name]))] for name in names} for _ in range(n_samples)]
+
+def _init_sweep_worker(shapes, names, cost_queue):
+    """
+    Pool initializer: attach the worker to the shared training set and to the queue streaming costs back.
+    """
+    for key in ["X", "Y"]:
+        _worker_state[key] = _shared_array(shapes[key], name=names[key])
+    _worker_state["cost_queue"] = cost_queue
+
+def _sweep_train(job):
+    """
+    Train one configuration from iteration start to stop, streaming every cost back through the queue.
+    
+    Arguments:
+    job -- tuple (config_id, config, parameters, start, stop); parameters is None to start from the
+           initialization of the configuration's "model" ("L_layer" or "two_layer")
+    
+    Returns:
+    config_id, parameters, costs -- the parameters after iteration stop and the cost of every iteration run
+    """
+    config_id, config, parameters, start, stop = job
+    X = _worker_state["X"][1]
+    Y = _worker_state["Y"][1]
+    
+    if parameters is None and config.get("model", "L_layer") == "two_layer":
+        parameters = initialize_parameters(*config["layers_dims"])
+    elif parameters is None:
+        parameters = initialize_parameters_deep(config["layers_dims"])
+    
+    costs = []
+    for i in range(start, stop):
+        AL, caches = L_model_forward(X, parameters)
+        cost = compute_cost(AL, Y)
+        grads = L_model_backward(AL, Y, caches)
+        parameters = update_parameters(parameters, grads, config["learning_rate"])
+        costs.append(float(cost))
+        _worker_state["cost_queue"].put((config_id, i, float(cost)))
+    
+    return config_id, parameters, costs
+
+def _ranking_cost(costs):
+    """
+    Sort key of a configuration: its last cost, with a diverged (nan or infinite) or missing cost ranked last.
+    """
+    if not costs or not np.isfinite(costs[-1]):
+        return np.inf
+    return costs[-1]
+
+def hyperparameter_sweep(X, Y, configs, num_iterations = 2500, n_workers = 4, blas_threads = 1, min_iterations = None, eta = 3,
+                         on_cost = None):
+    """
+    Train many configurations of two_layer_model() / L_layer_model() concurrently in a pool of processes,
+    optionally stopping the losing ones early with successive halving.
+    
+    The training set is copied once into shared memory and every worker maps it. Workers are started with
+    the BLAS thread count pinned to blas_threads, so that n_workers * blas_threads cores are used without
+    oversubscription. Every iteration's cost is streamed back to the parent and passed to on_cost.
+    
+    With min_iterations set, all the configurations first run min_iterations iterations; only the best
+    1/eta of them (lowest cost) continue, for eta times more iterations, and so on until num_iterations.
+    
+    Arguments:
+    X -- input data, of shape (n_x, number of examples)
+    Y -- true "label" vector, of shape (1, number of examples)
+    configs -- list of python dictionaries with keys "layers_dims", "learning_rate" and optionally
+               "model" ("L_layer", the default, or "two_layer"), e.g. the output of sweep_search_space()
+    num_iterations -- number of iterations of the configurations that are trained to the end
+    n_workers -- number of worker processes
+    blas_threads -- number of BLAS threads in every worker
+    min_iterations -- iterations of the first successive-halving rung (a positive integer), None to train every
+                      configuration fully
+    eta -- factor by which the number of configurations shrinks and the budget grows at every rung, greater than 1
+    on_cost -- optional function called in the parent as on_cost(config_index, iteration, cost)
+    
+    Returns:
+    results -- list of python dictionaries with keys "config", "parameters", "costs" (every iteration run)
+               and "iterations", sorted from the lowest to the highest final cost, diverged runs last
+    """
+    
+    if min_iterations is not None and min_iterations < 1:
+        raise ValueError("min_iterations must be a positive number of iterations, got {}".format(min_iterations))
+    if eta <= 1:
+        raise ValueError("eta must be greater than 1, got {}".format(eta))
+    
+    budgets = []
+    if min_iterations is not None:
+        budget = int(min_iterations)
+        while budget < num_iterations:
+            budgets.append(budget)
+            budget = int(math.ceil(budget * eta))
+    budgets.append(num_iterations)
+    
+    shapes = {"X": X.shape, "Y": (1, X.shape[1])}
+    shared = {key: _shared_array(shape) for key, shape in shapes.items()}
+    names = {key: shm.name for key, (shm, array) in shared.items()}
+    
+    # Spawned workers import NumPy afresh, so the thread limits set here apply to their BLAS
+    context = multiprocessing.get_context("spawn")
+    blas_variables = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+    saved_environment = {name: os.environ.get(name) for name in blas_variables}
+    
+    results = [{"config": config, "parameters": None, "costs": [], "iterations": 0} for config in configs]
+    
+    try:
+        shared["X"][1][...] = X
+        shared["Y"][1][...] = Y.reshape(1, -1)
+        cost_queue = context.Queue()
+        
+        os.environ.update({name: str(blas_threads) for name in blas_variables})
+        try:
+            pool = context.Pool(n_workers, initializer=_init_sweep_worker, initargs=(shapes, names, cost_queue))
+        finally:
+            for name, value in saved_environment.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        
+        with pool:
+            alive = list(range(len(configs)))
+            
+            for rung, budget in enumerate(budgets):
+                jobs = [(k, configs[k], results[k]["parameters"], results[k]["iterations"], budget) for k in alive]
+                pending = pool.map_async(_sweep_train, jobs)
+                
+                # Stream the costs while the rung runs. Every iteration sends exactly one cost, so wait for all
+                # of them: a worker may return before its queue has flushed, and closing the pool would drop them
+                expected = sum(budget - results[k]["iterations"] for k in alive)
+                received = 0
+                while received < expected:
+                    try:
+                        config_id, i, cost = cost_queue.get(timeout = 0.1)
+                    except queue.Empty:
+                        if pending.ready() and not pending.successful():
+                            pending.get()           # re-raise the worker's exception
+                        continue
+                    received += 1
+                    if on_cost is not None:
+                        on_cost(config_id, i, cost)
+                
+                for config_id, parameters, costs in pending.get():
+                    results[config_id]["parameters"] = parameters
+                    results[config_id]["costs"] += costs
+                    results[config_id]["iterations"] = budget
+                
+                # Successive halving: keep the best 1/eta configurations for the next rung
+                if rung < len(budgets) - 1:
+                    alive.sort(key = lambda k: _ranking_cost(results[k]["costs"]))
+                    alive = alive[:max(1, math.ceil(len(alive) / eta))]
+    
+    finally:
+        for shm, array in shared.values():
+            shm.close()
+            shm.unlink()
+    
+    return sorted(results, key = lambda result: (-result["iterations"], _ranking_cost(result["costs"])))
+
+
+_IMPORT_PROBE = """
+import resource, sys, time
+sys.path.insert(0, sys.argv[1])
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+__import__(sys.argv[2])
+seconds = time.perf_counter() - start
+print(seconds, rss_before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def benchmark_import(module_paths, n_runs = 5):
+    """
+    Measure the startup cost of utility modules: each one is imported in n_runs fresh interpreters, which
+    report the import time and their peak resident memory (RSS) before and after the import. Run it on two
+    versions of the modules to compare them. Uses the resource module, so it only runs on Unix.
+    
+    Arguments:
+    module_paths -- list of paths of the .py files to import, e.g. ["dnn_app_utils_v3.py"]
+    n_runs -- number of interpreters per module; the fastest import is kept
+    
+    Returns:
+    results -- python dictionary mapping each path to its "seconds" (import time), "rss_mb" (peak RSS after
+               the import) and "import_rss_mb" (RSS added by the import)
+    """
+    
+    results = {}
+    for path in module_paths:
+        directory, file_name = os.path.split(os.path.abspath(path))
+        runs = []
+        for i in range(n_runs):
+            output = subprocess.run([sys.executable, "-c", _IMPORT_PROBE, directory, file_name[:-3]],
+                                    capture_output=True, text=True, check=True).stdout.split()
+            runs.append([float(value) for value in output])
+        seconds, rss_before, rss_after = min(runs)
+        # ru_maxrss is in kilobytes on Linux
+        results[path] = {"seconds": seconds, "rss_mb": rss_after / 1024, "import_rss_mb": (rss_after - rss_before) / 1024}
+        print("{:<40} {:8.1f} ms   RSS {:7.1f} MB (+{:.1f} MB)".format(
+            file_name, 1000 * seconds, results[path]["rss_mb"], results[path]["import_rss_mb"]))
+    
+    return results
@@ -181,3 +181,184 @@ def L_layer_model_test(target):
     ]
     
     multiple_test(test_cases, target)
+
+def update_parameters_flat_test(target):
+    from dnn_app_utils_v3 import initialize_parameters_flat
+    
+    layers_dims = [5, 4, 3, 1]
+    for theta_dtype, dtheta_dtype in [(np.float64, np.float64), (np.float32, np.float32),
+                                      (np.float32, np.float64), (np.float64, np.float32)]:
+        parameters, theta = initialize_parameters_flat(layers_dims, dtype=theta_dtype)
+        np.random.seed(2)
+        dtheta = np.random.randn(theta.size).astype(dtheta_dtype)
+        expected = theta - (0.1 * dtheta).astype(theta_dtype)
+        W1 = parameters["W1"]
+        
+        result = target(theta, dtheta, 0.1)
+        
+        assert result is theta, "theta must be updated in place and returned"
+        assert theta.dtype == theta_dtype, "theta must keep its dtype"
+        assert np.allclose(theta, expected, rtol=1e-6), "Wrong update for theta {} / dtheta {}".format(
+            np.dtype(theta_dtype), np.dtype(dtheta_dtype))
+        assert np.shares_memory(W1, theta) and np.array_equal(W1.ravel(), theta[:W1.size]), \
+            "The parameter views must see the new values"
+    
+    print("\033[92m All tests passed.")
+
+def initialize_workspace_test(target):
+    from dnn_app_utils_v3 import initialize_parameters_deep, L_model_forward, L_model_backward, sigmoid_cross_entropy
+    
+    layers_dims = [6, 5, 4, 1]
+    m = 7
+    for dtype in [np.float64, np.float32]:
+        np.random.seed(3)
+        parameters = {k: v.astype(dtype) for k, v in initialize_parameters_deep(layers_dims).items()}
+        workspace = target(layers_dims, m, dtype=dtype)
+        
+        # Run twice through the same buffers, so that stale values left by the first pass would show up
+        for i in range(2):
+            X = np.random.randn(layers_dims[0], m).astype(dtype)
+            Y = (np.random.rand(1, m) > 0.5).astype(dtype)
+            
+            AL, caches = L_model_forward(X, parameters)
+            grads = L_model_backward(AL, Y, caches)
+            _, dZL = sigmoid_cross_entropy(caches[-1][1], Y)
+            grads_fused = L_model_backward(AL, Y, caches, dZL=dZL)
+            
+            AL_ws, caches_ws = L_model_forward(X, parameters, workspace=workspace)
+            assert AL_ws.dtype == dtype, "Wrong dtype for AL with a workspace"
+            assert np.shares_memory(AL_ws, workspace["A" + str(len(layers_dims) - 1)]), "AL must be written into the workspace"
+            assert np.allclose(AL_ws, AL), "L_model_forward with a workspace differs from the allocating version"
+            
+            for reference, dZL_ws in [(grads, None), (grads_fused, dZL)]:
+                grads_ws = L_model_backward(AL_ws, Y, caches_ws, workspace=workspace, dZL=dZL_ws)
+                for l in range(1, len(layers_dims)):
+                    for key in ["dW" + str(l), "db" + str(l)]:
+                        assert grads_ws[key].dtype == dtype, "Wrong dtype for {}".format(key)
+                        assert np.shares_memory(grads_ws[key], workspace["dtheta"]), "{} must be a view into dtheta".format(key)
+                        assert np.allclose(grads_ws[key], reference[key], rtol=1e-5, atol=1e-6), \
+                            "Wrong {} with a workspace ({})".format(key, np.dtype(dtype))
+    
+    print("\033[92m All tests passed.")
+
+def L_layer_model_data_parallel_test(target):
+    from dnn_app_utils_v3 import initialize_parameters_deep, L_model_forward, compute_cost, L_model_backward, update_parameters
+    
+    learning_rate = 0.0075
+    num_iterations = 101
+    for seed, layers_dims, num_examples in [(1, (10, 5, 6, 1), 10), (2, (30, 20, 7, 5, 1), 209)]:
+        np.random.seed(seed)
+        X = np.random.randn(layers_dims[0], num_examples)
+        Y = (np.random.rand(1, num_examples) > 0.5).astype(int)
+        
+        # Reference: the single-process loop of L_layer_model()
+        expected_parameters = initialize_parameters_deep(layers_dims)
+        expected_costs = []
+        for i in range(num_iterations):
+            AL, caches = L_model_forward(X, expected_parameters)
+            cost = compute_cost(AL, Y)
+            grads = L_model_backward(AL, Y, caches)
+            expected_parameters = update_parameters(expected_parameters, grads, learning_rate)
+            if i % 100 == 0 or i == num_iterations - 1:
+                expected_costs.append(cost)
+        
+        for n_workers in [1, 2, 3]:
+            parameters, costs = target(X, Y, layers_dims, learning_rate, num_iterations, n_workers=n_workers)
+            
+            assert parameters.keys() == expected_parameters.keys(), "Wrong parameter names"
+            for key in expected_parameters:
+                assert np.array_equal(parameters[key], expected_parameters[key]), \
+                    "{} differs from the single-process result with n_workers={}".format(key, n_workers)
+            assert costs == expected_costs, "Wrong costs with n_workers={}".format(n_workers)
+    
+    print("\033[92m All tests passed.")
+
+def save_checkpoint_test(target):
+    import os
+    import tempfile
+    from dnn_app_utils_v3 import initialize_parameters_deep, L_model_forward, load_checkpoint
+    
+    layers_dims = [5, 4, 3, 1]
+    parameters = initialize_parameters_deep(layers_dims)
+    parameters["W2"] = parameters["W2"].astype(np.float32)
+    np.random.seed(2)
+    X = np.random.randn(5, 7)
+    expected_AL, _ = L_model_forward(X, parameters)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "model.ckpt")
+        target(parameters, path)
+        assert os.listdir(directory) == ["model.ckpt"], "No temporary file may be left next to the checkpoint"
+        
+        loaded = load_checkpoint(path)
+        assert list(loaded.keys()) == list(parameters.keys()), "Wrong names or order"
+        for key, value in parameters.items():
+            assert loaded[key].dtype == value.dtype and loaded[key].shape == value.shape, "Wrong dtype or shape for " + key
+            assert np.array_equal(loaded[key], value), "Wrong values for " + key
+        AL, _ = L_model_forward(X, loaded)
+        assert np.array_equal(AL, expected_AL), "L_model_forward must give the same output on the loaded parameters"
+        assert not loaded["W1"].flags.writeable, "mode='r' arrays must be read-only"
+        del loaded, AL
+        
+        copied = load_checkpoint(path, mode="c")
+        assert copied["W1"].flags.writeable, "mode='c' arrays must be writable"
+        copied["W1"][...] = 0
+        copy_on_write = load_checkpoint(path)
+        assert np.array_equal(copy_on_write["W1"], parameters["W1"]), "mode='c' writes must not reach the file"
+        del copied, copy_on_write
+        
+        try:
+            target({"W1": parameters["W1"], "names": np.array(["a", "b"], dtype=object)}, os.path.join(directory, "bad.ckpt"))
+            assert False, "An object array must be rejected"
+        except TypeError:
+            pass
+        assert os.listdir(directory) == ["model.ckpt"], "A rejected checkpoint must not create any file"
+    
+    print("\033[92m All tests passed.")
+
+def hyperparameter_sweep_test(target):
+    from dnn_app_utils_v3 import initialize_parameters_deep, L_model_forward, compute_cost, L_model_backward, update_parameters
+    
+    np.random.seed(3)
+    X = np.random.randn(4, 20)
+    Y = (np.random.rand(1, 20) > 0.5).astype(int)
+    configs = [{"layers_dims": [4, 3, 1], "learning_rate": learning_rate} for learning_rate in [0.5, 0.05, 0.005, 1e5]]
+    
+    # Reference: the cost of every iteration of each configuration trained on its own
+    def train(config, num_iterations):
+        parameters = initialize_parameters_deep(config["layers_dims"])
+        costs = []
+        with np.errstate(all = "ignore"):       # the last configuration diverges on purpose
+            for i in range(num_iterations):
+                AL, caches = L_model_forward(X, parameters)
+                costs.append(float(compute_cost(AL, Y)))
+                parameters = update_parameters(parameters, L_model_backward(AL, Y, caches), config["learning_rate"])
+        return parameters, costs
+    
+    streamed = []
+    results = target(X, Y, configs, num_iterations = 8, n_workers = 2, min_iterations = 2, eta = 2,
+                     on_cost = lambda k, i, cost: streamed.append((k, i)))
+    
+    # Rungs of 2, 4 and 8 iterations: 4 configurations, then the best 2, then the best one
+    assert [result["iterations"] for result in results] == [8, 4, 2, 2], "Wrong successive-halving budgets"
+    assert len(streamed) == 2 * 4 + 2 * 2 + 4 * 1, "Every iteration's cost must be streamed"
+    for result in results:
+        parameters, costs = train(result["config"], result["iterations"])
+        assert np.array_equal(result["costs"], costs, equal_nan = True), "Wrong costs for learning_rate={}".format(result["config"]["learning_rate"])
+        for key in parameters:
+            assert np.array_equal(result["parameters"][key], parameters[key], equal_nan = True), "Wrong parameters"
+    
+    # Only the configurations with the lowest cost after the first rung continue, a diverged one never does
+    first_rung = [train(config, 2)[1][-1] for config in configs]
+    ranking = sorted(range(len(configs)), key = lambda k: first_rung[k] if np.isfinite(first_rung[k]) else np.inf)
+    survivors = sorted(result["config"]["learning_rate"] for result in results[:2])
+    assert survivors == sorted(configs[k]["learning_rate"] for k in ranking[:2]), "Wrong survivors of the first rung"
+    
+    for kwargs in [{"min_iterations": 0}, {"min_iterations": -3}, {"min_iterations": 2, "eta": 1}, {"min_iterations": 2, "eta": 0.5}]:
+        try:
+            target(X, Y, configs, num_iterations = 8, n_workers = 1, **kwargs)
+            assert False, "{} must be rejected".format(kwargs)
+        except ValueError:
+            pass
+    
+    print("\033[92m All tests passed.")
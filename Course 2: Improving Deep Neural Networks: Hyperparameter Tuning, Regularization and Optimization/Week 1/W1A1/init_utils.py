@@ -1,8 +1,5 @@
+import hashlib
 import numpy as np
-import matplotlib.pyplot as plt
-import h5py
-import sklearn
-import sklearn.datasets
 
 def sigmoid(x):
     """
@@ -148,6 +145,7 @@ def compute_loss(a3, Y):
     return loss
 
 def load_cat_dataset():
+    import h5py
     train_dataset = h5py.File('datasets/train_catvnoncat.h5', "r")
     train_set_x_orig = np.array(train_dataset["train_set_x"][:]) # your train set features
     train_set_y_orig = np.array(train_dataset["train_set_y"][:]) # your train set labels
@@ -170,46 +168,143 @@ def load_cat_dataset():
     return train_set_x, train_set_y, test_set_x, test_set_y, classes
 
 
-def predict(X, y, parameters):
+def predict(X, y, parameters, chunk_size = 4096):
     """
     This function is used to predict the results of a  n-layer neural network.
     
     Arguments:
     X -- data set of examples you would like to label
     parameters -- parameters of the trained model
+    chunk_size -- number of examples pushed through forward_propagation() at a time, bounding the memory of the caches
     
     Returns:
     p -- predictions for the given dataset X
     """
     
     m = X.shape[1]
-    p = np.zeros((1,m), dtype = np.int)
+    p = np.zeros((1,m), dtype = int)
     
-    # Forward propagation
-    a3, caches = forward_propagation(X, parameters)
-    
-    # convert probas to 0/1 predictions
-    for i in range(0, a3.shape[1]):
-        if a3[0,i] > 0.5:
-            p[0,i] = 1
-        else:
-            p[0,i] = 0
+    for start in range(0, m, chunk_size):
+        # Forward propagation
+        a3, caches = forward_propagation(X[:, start:start + chunk_size], parameters)
+        
+        # convert probas to 0/1 predictions
+        p[:, start:start + chunk_size] = a3 > 0.5
 
     # print results
     print("Accuracy: "  + str(np.mean((p[0,:] == y[0,:]))))
     
     return p
 
-def plot_decision_boundary(model, X, y):
+_boundary_cache = {}
+
+def parameters_hash(parameters):
+    """
+    Hash the values of a parameters dictionary (or of a single array), used as the decision boundary cache key.
+    
+    Arguments:
+    parameters -- python dictionary of numpy arrays, or a numpy array
+    
+    Returns:
+    digest -- hexadecimal SHA-1 digest of the keys, dtypes, shapes and values
+    """
+    digest = hashlib.sha1()
+    items = sorted(parameters.items()) if isinstance(parameters, dict) else [("", parameters)]
+    for key, value in items:
+        value = np.ascontiguousarray(value)
+        digest.update(str((key, value.dtype.str, value.shape)).encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+def _evaluate_points(model, px, py, tile_size):
+    """
+    Evaluate model on the points (px[i], py[i]), tile_size points per call.
+    """
+    values = np.empty(px.size)
+    for start in range(0, px.size, tile_size):
+        stop = start + tile_size
+        values[start:stop] = np.ravel(model(np.c_[px[start:stop], py[start:stop]]))
+    return values
+
+def decision_boundary_grid(model, x_range, y_range, target_pixels = 250000, levels = 4, threshold = 0.5, tile_size = 65536):
+    """
+    Evaluate model on a regular grid of about target_pixels points covering x_range by y_range.
+    
+    The model is first evaluated on every 2**levels-th grid point. Each level then halves the spacing, and only
+    the cells whose corners straddle threshold are evaluated at the new points (adaptive quadtree); the other
+    cells are filled by interpolating their corners, which is exact for the 0/1 labels returned by the usual
+    predict functions. Decision regions narrower than a coarse cell can therefore be missed.
+    
+    Arguments:
+    model -- function mapping an (n, 2) array of points to n outputs
+    x_range -- (x_min, x_max)
+    y_range -- (y_min, y_max)
+    target_pixels -- approximate number of grid points, sets the resolution
+    levels -- number of refinement levels
+    threshold -- decision threshold on the model output
+    tile_size -- maximum number of points passed to model in a single call
+    
+    Returns:
+    xx, yy -- grid coordinates, as returned by np.meshgrid
+    Z -- model output on the grid, same shape as xx
+    """
+    x_min, x_max = x_range
+    y_min, y_max = y_range
+    step = np.sqrt((x_max - x_min) * (y_max - y_min) / target_pixels)
+    s = 2 ** levels
+    xs = np.linspace(x_min, x_max, max(1, int(np.ceil((x_max - x_min) / (step * s)))) * s + 1)
+    ys = np.linspace(y_min, y_max, max(1, int(np.ceil((y_max - y_min) / (step * s)))) * s + 1)
+    Z = np.empty((ys.size, xs.size))
+    
+    # Coarsest level: evaluate every s-th point
+    iy, ix = np.meshgrid(np.arange(0, ys.size, s), np.arange(0, xs.size, s), indexing = 'ij')
+    Z[::s, ::s] = _evaluate_points(model, xs[ix.ravel()], ys[iy.ravel()], tile_size).reshape(ix.shape)
+    
+    while s > 1:
+        h = s // 2
+        G = Z[::h, ::h]                       # view of the grid at the new spacing, known points at even indices
+        C = G[::2, ::2]
+        corners = np.stack([C[:-1, :-1], C[:-1, 1:], C[1:, :-1], C[1:, 1:]])
+        refine = (corners.min(axis = 0) <= threshold) & (corners.max(axis = 0) > threshold)
+        
+        # Interpolate the new points, then evaluate those of the cells that straddle the threshold
+        G[1::2, ::2] = (C[:-1, :] + C[1:, :]) / 2
+        G[::2, 1::2] = (C[:, :-1] + C[:, 1:]) / 2
+        G[1::2, 1::2] = corners.mean(axis = 0)
+        evaluate = np.zeros(G.shape, dtype = bool)
+        ci, cj = np.nonzero(refine)
+        for di, dj in ((1, 1), (0, 1), (2, 1), (1, 0), (1, 2)):
+            evaluate[2 * ci + di, 2 * cj + dj] = True
+        gi, gj = np.nonzero(evaluate)
+        G[gi, gj] = _evaluate_points(model, xs[gj * h], ys[gi * h], tile_size)
+        s = h
+    
+    xx, yy = np.meshgrid(xs, ys)
+    return xx, yy, Z
+
+def plot_decision_boundary(model, X, y, parameters = None, target_pixels = 250000, levels = 4):
+    """
+    Plot the decision regions of model over the data range, see decision_boundary_grid().
+    
+    Passing the parameters the model was built from caches the grid under their hash and the plotting
+    range, so re-plotting the same model is free.
+    """
+    import matplotlib.pyplot as plt
     # Set min and max values and give it some padding
     x_min, x_max = X[0, :].min() - 1, X[0, :].max() + 1
     y_min, y_max = X[1, :].min() - 1, X[1, :].max() + 1
-    h = 0.01
-    # Generate a grid of points with distance h between them
-    xx, yy = np.meshgrid(np.arange(x_min, x_max, h), np.arange(y_min, y_max, h))
-    # Predict the function value for the whole grid
-    Z = model(np.c_[xx.ravel(), yy.ravel()])
-    Z = Z.reshape(xx.shape)
+    key = None
+    if parameters is not None:
+        key = (parameters_hash(parameters), x_min, x_max, y_min, y_max, target_pixels, levels)
+    if key is not None and key in _boundary_cache:
+        xx, yy, Z = _boundary_cache[key]
+    else:
+        # Predict the function value on the grid, refining only around the boundary
+        xx, yy, Z = decision_boundary_grid(model, (x_min, x_max), (y_min, y_max), target_pixels, levels)
+        if key is not None:
+            _boundary_cache[key] = (xx, yy, Z)
+            if len(_boundary_cache) > 8:
+                del _boundary_cache[next(iter(_boundary_cache))]
     # Plot the contour and training examples
     plt.contourf(xx, yy, Z, cmap=plt.cm.Spectral)
     plt.ylabel('x2')
@@ -235,6 +330,8 @@ def predict_dec(parameters, X):
     return predictions
 
 def load_dataset():
+    import sklearn.datasets
+    import matplotlib.pyplot as plt
     np.random.seed(1)
     train_X, train_Y = sklearn.datasets.make_circles(n_samples=300, noise=.05)
     np.random.seed(2)
@@ -230,6 +230,36 @@ def backward_propagation_with_dropout_test(target):
     
     multiple_test(test_cases, target)
 
+def dropout_forward_test(target):
+    keep_prob = 0.7
+    np.random.seed(1)
+    A = np.random.randn(4, 13)
+    
+    # Reference: the unpacked mask of the notebook, drawn from the same seed
+    np.random.seed(2)
+    D_ref = (np.random.rand(A.shape[0], A.shape[1]) < keep_prob).astype(int)
+    expected_A = A * D_ref / keep_prob
+    
+    np.random.seed(2)
+    A_drop, D = target(A, keep_prob)
+    
+    assert D.dtype == np.uint8 and D.shape == (4, 2), "The mask must be packed to 1 bit per neuron"
+    assert np.array_equal(np.unpackbits(D, axis=-1, count=A.shape[1]), D_ref), "Wrong mask"
+    assert A_drop.shape == A.shape, "Wrong shape"
+    assert np.allclose(A_drop, expected_A), "Wrong output"
+    
+    print("\033[92m All tests passed.")
 
-
+def dropout_backward_test(target):
+    keep_prob = 0.7
+    np.random.seed(1)
+    dA = np.random.randn(4, 13)
+    D_ref = (np.random.rand(4, 13) < keep_prob).astype(int)
+    expected_dA = dA * D_ref / keep_prob
+    
+    dA_drop = target(dA, np.packbits(D_ref.astype(bool), axis=-1), keep_prob)
+    
+    assert dA_drop.shape == dA.shape, "Wrong shape"
+    assert np.allclose(dA_drop, expected_dA), "Wrong output"
     
+    print("\033[92m All tests passed.")
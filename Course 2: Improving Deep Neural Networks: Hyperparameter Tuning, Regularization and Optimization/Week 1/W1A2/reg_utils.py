@@ -1,10 +1,7 @@
+import hashlib
+import os
+from multiprocessing import Pool
 import numpy as np
-import matplotlib.pyplot as plt
-import h5py
-import sklearn
-import sklearn.datasets
-import sklearn.linear_model
-import scipy.io
 
 def sigmoid(x):
     """
@@ -56,6 +53,129 @@ def load_planar_dataset(seed):
 
     return X, Y
 
+_toy_noise = {"flower": 0.2, "moons": 0.2, "circles": 0.3, "blobs": 1.0}
+
+def toy_dataset_chunk(kind, m, index, seed = 0, chunk_size = 65536, noise = None, dtype = np.float64):
+    """
+    Generate chunk number index of a synthetic 2D dataset of m examples, see generate_toy_dataset().
+    
+    Each chunk draws from its own random stream, seeded by (seed, index), so the chunks can be generated in
+    any order and in separate processes. The dataset therefore depends on seed and chunk_size, not on the
+    order or the process in which the chunks are generated.
+    
+    Arguments:
+    kind -- "flower", "moons", "circles" or "blobs"
+    m -- number of examples of the whole dataset
+    index -- index of the chunk, covering examples index*chunk_size to (index+1)*chunk_size - 1
+    seed -- seed of the dataset
+    chunk_size -- number of examples per chunk
+    noise -- standard deviation of the gaussian noise, defaults to 0.2 for "flower" and "moons", 0.3 for
+             "circles" and 1.0 for "blobs"
+    dtype -- dtype of X
+    
+    Returns:
+    X -- data of the chunk, numpy array of shape (2, number of examples in the chunk)
+    Y -- labels of the chunk, numpy array of shape (1, number of examples in the chunk)
+    """
+    if kind not in _toy_noise:
+        raise ValueError("Unknown dataset kind: " + str(kind))
+    noise = _toy_noise[kind] if noise is None else noise
+    n_classes = 6 if kind == "blobs" else 2
+    i = np.arange(index * chunk_size, min((index + 1) * chunk_size, m))
+    n = i.size
+    rng = np.random.default_rng([seed, index])
+    
+    # Classes are interleaved: example i belongs to class i % n_classes, at position k along that class
+    Y = i % n_classes
+    k = i // n_classes
+    n_class = (m - Y + n_classes - 1) // n_classes   # number of examples of each example's class
+    
+    if kind == "flower":
+        a = 4 # maximum ray of the flower
+        t = (Y + k / np.maximum(n_class - 1, 1)) * 3.12 + rng.standard_normal(n) * noise # theta
+        r = a * np.sin(4 * t) + rng.standard_normal(n) * noise # radius
+        X = np.stack([r * np.sin(t), r * np.cos(t)])
+    elif kind == "moons":
+        t = np.pi * k / np.maximum(n_class - 1, 1)
+        X = np.where(Y == 0, np.stack([np.cos(t), np.sin(t)]), np.stack([1 - np.cos(t), 0.5 - np.sin(t)]))
+        X += rng.standard_normal((2, n)) * noise
+    elif kind == "circles":
+        t = 2 * np.pi * k / n_class
+        X = np.where(Y == 0, 1.0, 0.5) * np.stack([np.cos(t), np.sin(t)]) + rng.standard_normal((2, n)) * noise
+    else:
+        centers = np.random.default_rng(seed).uniform(-10, 10, (2, n_classes))
+        X = centers[:, Y] + rng.standard_normal((2, n)) * noise
+    
+    return X.astype(dtype, copy = False), Y.reshape(1, n).astype('uint8')
+
+def toy_dataset_chunks(kind, m, seed = 0, chunk_size = 65536, noise = None, dtype = np.float64):
+    """
+    Stream a synthetic 2D dataset of m examples in chunks of chunk_size examples, see toy_dataset_chunk().
+    
+    Yields:
+    (X, Y) -- data of shape (2, n) and labels of shape (1, n) of each chunk, in order
+    """
+    for index in range(-(-m // chunk_size)):
+        yield toy_dataset_chunk(kind, m, index, seed, chunk_size, noise, dtype)
+
+def _toy_chunk_job(job):
+    """
+    Pool worker of generate_toy_dataset(): generates one chunk and writes it to the .npy files, or returns it.
+    """
+    path, kind, m, index, seed, chunk_size, noise, dtype = job
+    X, Y = toy_dataset_chunk(kind, m, index, seed, chunk_size, noise, dtype)
+    if path is None:
+        return X, Y
+    start = index * chunk_size
+    for name, chunk in (("X.npy", X), ("Y.npy", Y)):
+        out = np.load(os.path.join(path, name), mmap_mode = "r+")
+        out[:, start:start + chunk.shape[1]] = chunk
+        out.flush()
+    return None
+
+def generate_toy_dataset(kind = "flower", m = 400, seed = 0, chunk_size = 65536, noise = None, dtype = np.float64, path = None, n_jobs = 1):
+    """
+    Generate a synthetic 2D dataset of m examples, vectorised chunk by chunk into preallocated arrays: the
+    "flower" of planar_utils.load_planar_dataset(), or "moons", "circles" and "blobs" shaped like the
+    sklearn.datasets make_moons, make_circles and make_blobs datasets.
+    
+    Arguments:
+    kind, m, seed, chunk_size, noise, dtype -- see toy_dataset_chunk()
+    path -- if given, directory where X and Y are written as X.npy and Y.npy memory-mapped files, so that m
+            can exceed the available memory
+    n_jobs -- number of processes generating the chunks
+    
+    Returns:
+    X -- data, numpy array (or memmap) of shape (2, m)
+    Y -- labels, numpy array (or memmap) of shape (1, m)
+    """
+    if path is None:
+        X = np.empty((2, m), dtype = dtype)
+        Y = np.empty((1, m), dtype = 'uint8')
+    else:
+        os.makedirs(path, exist_ok = True)
+        X = np.lib.format.open_memmap(os.path.join(path, "X.npy"), mode = "w+", dtype = dtype, shape = (2, m))
+        Y = np.lib.format.open_memmap(os.path.join(path, "Y.npy"), mode = "w+", dtype = 'uint8', shape = (1, m))
+    
+    jobs = [(path, kind, m, index, seed, chunk_size, noise, dtype) for index in range(-(-m // chunk_size))]
+    if n_jobs > 1:
+        # With a path the workers write straight into the shared files and return nothing
+        with Pool(n_jobs) as pool:
+            for index, chunk in enumerate(pool.imap(_toy_chunk_job, jobs)):
+                if chunk is not None:
+                    start = index * chunk_size
+                    X[:, start:start + chunk[0].shape[1]], Y[:, start:start + chunk[1].shape[1]] = chunk
+    else:
+        for index, (X_chunk, Y_chunk) in enumerate(toy_dataset_chunks(kind, m, seed, chunk_size, noise, dtype)):
+            start = index * chunk_size
+            X[:, start:start + X_chunk.shape[1]] = X_chunk
+            Y[:, start:start + Y_chunk.shape[1]] = Y_chunk
+    
+    if path is not None:
+        X.flush()
+        Y.flush()
+    return X, Y
+
 def initialize_parameters(layer_dims):
     """
     Arguments:
@@ -161,6 +281,119 @@ def backward_propagation(X, Y, cache):
     
     return gradients
 
+def dropout_forward(A, keep_prob):
+    """
+    Inverted dropout with a bit-packed mask: draws the same np.random.rand() mask as the Regularization notebook,
+    and shuts down and scales the neurons in a single pass over A.
+    
+    Arguments:
+    A -- activations, of shape (n, m)
+    keep_prob -- probability of keeping a neuron active during drop-out, scalar
+    
+    Returns:
+    A -- activations after dropout, equal to A * D / keep_prob up to rounding
+    D -- mask packed to 1 bit per neuron with np.packbits along the examples axis, of shape (n, ceil(m / 8))
+    """
+    mask = np.random.rand(A.shape[0], A.shape[1]) < keep_prob
+    # The keep_prob scaling is folded into the mask (1 / keep_prob where kept, 0 elsewhere), so A is masked and
+    # scaled by one multiplication, written over the scaled mask
+    scale = np.multiply(mask, 1 / keep_prob, dtype=np.result_type(A, keep_prob))
+    A_drop = np.multiply(A, scale, out=scale)
+    D = np.packbits(mask, axis=-1)
+    
+    return A_drop, D
+
+def dropout_backward(dA, D, keep_prob):
+    """
+    Backward pass of dropout_forward(): shuts down the same neurons and scales the kept ones in a single pass over dA.
+    
+    Arguments:
+    dA -- gradient of the cost with respect to the activations after dropout, of shape (n, m)
+    D -- packed mask returned by dropout_forward()
+    keep_prob -- probability of keeping a neuron active during drop-out, scalar
+    
+    Returns:
+    dA -- gradient with respect to the activations before dropout, equal to dA * D / keep_prob up to rounding
+    """
+    mask = np.unpackbits(D, axis=-1, count=dA.shape[-1]).view(bool)
+    scale = np.multiply(mask, 1 / keep_prob, dtype=np.result_type(dA, keep_prob))
+    dA_drop = np.multiply(dA, scale, out=scale)
+    
+    return dA_drop
+
+def forward_propagation_with_dropout(X, parameters, keep_prob = 0.5):
+    """
+    Implements the forward propagation: LINEAR -> RELU + DROPOUT -> LINEAR -> RELU + DROPOUT -> LINEAR -> SIGMOID,
+    with the dropout masks kept bit-packed in the cache (see dropout_forward()).
+    
+    Arguments:
+    X -- input dataset, of shape (2, number of examples)
+    parameters -- python dictionary containing your parameters "W1", "b1", "W2", "b2", "W3", "b3"
+    keep_prob - probability of keeping a neuron active during drop-out, scalar
+    
+    Returns:
+    A3 -- last activation value, output of the forward propagation, of shape (1,1)
+    cache -- tuple, information stored for computing the backward propagation
+    """
+    
+    np.random.seed(1)
+    
+    # retrieve parameters
+    W1 = parameters["W1"]
+    b1 = parameters["b1"]
+    W2 = parameters["W2"]
+    b2 = parameters["b2"]
+    W3 = parameters["W3"]
+    b3 = parameters["b3"]
+    
+    # LINEAR -> RELU + DROPOUT -> LINEAR -> RELU + DROPOUT -> LINEAR -> SIGMOID
+    Z1 = np.dot(W1, X) + b1
+    A1, D1 = dropout_forward(relu(Z1), keep_prob)
+    Z2 = np.dot(W2, A1) + b2
+    A2, D2 = dropout_forward(relu(Z2), keep_prob)
+    Z3 = np.dot(W3, A2) + b3
+    A3 = sigmoid(Z3)
+    
+    cache = (Z1, D1, A1, W1, b1, Z2, D2, A2, W2, b2, Z3, A3, W3, b3)
+    
+    return A3, cache
+
+def backward_propagation_with_dropout(X, Y, cache, keep_prob):
+    """
+    Implements the backward propagation of our baseline model to which we added dropout.
+    
+    Arguments:
+    X -- input dataset, of shape (2, number of examples)
+    Y -- "true" labels vector, of shape (output size, number of examples)
+    cache -- cache output from forward_propagation_with_dropout()
+    keep_prob - probability of keeping a neuron active during drop-out, scalar
+    
+    Returns:
+    gradients -- A dictionary with the gradients with respect to each parameter, activation and pre-activation variables
+    """
+    
+    m = X.shape[1]
+    (Z1, D1, A1, W1, b1, Z2, D2, A2, W2, b2, Z3, A3, W3, b3) = cache
+    
+    dZ3 = A3 - Y
+    dW3 = 1./m * np.dot(dZ3, A2.T)
+    db3 = 1./m * np.sum(dZ3, axis=1, keepdims = True)
+    dA2 = dropout_backward(np.dot(W3.T, dZ3), D2, keep_prob)
+    dZ2 = np.multiply(dA2, np.int64(A2 > 0))
+    dW2 = 1./m * np.dot(dZ2, A1.T)
+    db2 = 1./m * np.sum(dZ2, axis=1, keepdims = True)
+    
+    dA1 = dropout_backward(np.dot(W2.T, dZ2), D1, keep_prob)
+    dZ1 = np.multiply(dA1, np.int64(A1 > 0))
+    dW1 = 1./m * np.dot(dZ1, X.T)
+    db1 = 1./m * np.sum(dZ1, axis=1, keepdims = True)
+    
+    gradients = {"dZ3": dZ3, "dW3": dW3, "db3": db3,"dA2": dA2,
+                 "dZ2": dZ2, "dW2": dW2, "db2": db2, "dA1": dA1, 
+                 "dZ1": dZ1, "dW1": dW1, "db1": db1}
+    
+    return gradients
+
 def update_parameters(parameters, grads, learning_rate):
     """
     Update parameters using gradient descent
@@ -187,30 +420,28 @@ def update_parameters(parameters, grads, learning_rate):
         
     return parameters
 
-def predict(X, y, parameters):
+def predict(X, y, parameters, chunk_size = 4096):
     """
     This function is used to predict the results of a  n-layer neural network.
     
     Arguments:
     X -- data set of examples you would like to label
     parameters -- parameters of the trained model
+    chunk_size -- number of examples pushed through forward_propagation() at a time, bounding the memory of the caches
     
     Returns:
     p -- predictions for the given dataset X
     """
     
     m = X.shape[1]
-    p = np.zeros((1,m), dtype = np.int)
-    
-    # Forward propagation
-    a3, caches = forward_propagation(X, parameters)
+    p = np.zeros((1,m), dtype = int)
     
-    # convert probas to 0/1 predictions
-    for i in range(0, a3.shape[1]):
-        if a3[0,i] > 0.5:
-            p[0,i] = 1
-        else:
-            p[0,i] = 0
+    for start in range(0, m, chunk_size):
+        # Forward propagation
+        a3, caches = forward_propagation(X[:, start:start + chunk_size], parameters)
+        
+        # convert probas to 0/1 predictions
+        p[:, start:start + chunk_size] = a3 > 0.5
 
     # print results
 
@@ -239,6 +470,7 @@ def compute_cost(a3, Y):
     return cost
 
 def load_dataset():
+    import h5py
     train_dataset = h5py.File('datasets/train_catvnoncat.h5', "r")
     train_set_x_orig = np.array(train_dataset["train_set_x"][:]) # your train set features
     train_set_y_orig = np.array(train_dataset["train_set_y"][:]) # your train set labels
@@ -307,16 +539,115 @@ def load_planar_dataset(randomness, seed):
 
     return X, Y
 
-def plot_decision_boundary(model, X, y):
+_boundary_cache = {}
+
+def parameters_hash(parameters):
+    """
+    Hash the values of a parameters dictionary (or of a single array), used as the decision boundary cache key.
+    
+    Arguments:
+    parameters -- python dictionary of numpy arrays, or a numpy array
+    
+    Returns:
+    digest -- hexadecimal SHA-1 digest of the keys, dtypes, shapes and values
+    """
+    digest = hashlib.sha1()
+    items = sorted(parameters.items()) if isinstance(parameters, dict) else [("", parameters)]
+    for key, value in items:
+        value = np.ascontiguousarray(value)
+        digest.update(str((key, value.dtype.str, value.shape)).encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+def _evaluate_points(model, px, py, tile_size):
+    """
+    Evaluate model on the points (px[i], py[i]), tile_size points per call.
+    """
+    values = np.empty(px.size)
+    for start in range(0, px.size, tile_size):
+        stop = start + tile_size
+        values[start:stop] = np.ravel(model(np.c_[px[start:stop], py[start:stop]]))
+    return values
+
+def decision_boundary_grid(model, x_range, y_range, target_pixels = 250000, levels = 4, threshold = 0.5, tile_size = 65536):
+    """
+    Evaluate model on a regular grid of about target_pixels points covering x_range by y_range.
+    
+    The model is first evaluated on every 2**levels-th grid point. Each level then halves the spacing, and only
+    the cells whose corners straddle threshold are evaluated at the new points (adaptive quadtree); the other
+    cells are filled by interpolating their corners, which is exact for the 0/1 labels returned by the usual
+    predict functions. Decision regions narrower than a coarse cell can therefore be missed.
+    
+    Arguments:
+    model -- function mapping an (n, 2) array of points to n outputs
+    x_range -- (x_min, x_max)
+    y_range -- (y_min, y_max)
+    target_pixels -- approximate number of grid points, sets the resolution
+    levels -- number of refinement levels
+    threshold -- decision threshold on the model output
+    tile_size -- maximum number of points passed to model in a single call
+    
+    Returns:
+    xx, yy -- grid coordinates, as returned by np.meshgrid
+    Z -- model output on the grid, same shape as xx
+    """
+    x_min, x_max = x_range
+    y_min, y_max = y_range
+    step = np.sqrt((x_max - x_min) * (y_max - y_min) / target_pixels)
+    s = 2 ** levels
+    xs = np.linspace(x_min, x_max, max(1, int(np.ceil((x_max - x_min) / (step * s)))) * s + 1)
+    ys = np.linspace(y_min, y_max, max(1, int(np.ceil((y_max - y_min) / (step * s)))) * s + 1)
+    Z = np.empty((ys.size, xs.size))
+    
+    # Coarsest level: evaluate every s-th point
+    iy, ix = np.meshgrid(np.arange(0, ys.size, s), np.arange(0, xs.size, s), indexing = 'ij')
+    Z[::s, ::s] = _evaluate_points(model, xs[ix.ravel()], ys[iy.ravel()], tile_size).reshape(ix.shape)
+    
+    while s > 1:
+        h = s // 2
+        G = Z[::h, ::h]                       # view of the grid at the new spacing, known points at even indices
+        C = G[::2, ::2]
+        corners = np.stack([C[:-1, :-1], C[:-1, 1:], C[1:, :-1], C[1:, 1:]])
+        refine = (corners.min(axis = 0) <= threshold) & (corners.max(axis = 0) > threshold)
+        
+        # Interpolate the new points, then evaluate those of the cells that straddle the threshold
+        G[1::2, ::2] = (C[:-1, :] + C[1:, :]) / 2
+        G[::2, 1::2] = (C[:, :-1] + C[:, 1:]) / 2
+        G[1::2, 1::2] = corners.mean(axis = 0)
+        evaluate = np.zeros(G.shape, dtype = bool)
+        ci, cj = np.nonzero(refine)
+        for di, dj in ((1, 1), (0, 1), (2, 1), (1, 0), (1, 2)):
+            evaluate[2 * ci + di, 2 * cj + dj] = True
+        gi, gj = np.nonzero(evaluate)
+        G[gi, gj] = _evaluate_points(model, xs[gj * h], ys[gi * h], tile_size)
+        s = h
+    
+    xx, yy = np.meshgrid(xs, ys)
+    return xx, yy, Z
+
+def plot_decision_boundary(model, X, y, parameters = None, target_pixels = 250000, levels = 4):
+    """
+    Plot the decision regions of model over the data range, see decision_boundary_grid().
+    
+    Passing the parameters the model was built from caches the grid under their hash and the plotting
+    range, so re-plotting the same model is free.
+    """
+    import matplotlib.pyplot as plt
     # Set min and max values and give it some padding
     x_min, x_max = X[0, :].min() - 1, X[0, :].max() + 1
     y_min, y_max = X[1, :].min() - 1, X[1, :].max() + 1
-    h = 0.01
-    # Generate a grid of points with distance h between them
-    xx, yy = np.meshgrid(np.arange(x_min, x_max, h), np.arange(y_min, y_max, h))
-    # Predict the function value for the whole grid
-    Z = model(np.c_[xx.ravel(), yy.ravel()])
-    Z = Z.reshape(xx.shape)
+    key = None
+    if parameters is not None:
+        key = (parameters_hash(parameters), x_min, x_max, y_min, y_max, target_pixels, levels)
+    if key is not None and key in _boundary_cache:
+        xx, yy, Z = _boundary_cache[key]
+    else:
+        # Predict the function value on the grid, refining only around the boundary
+        xx, yy, Z = decision_boundary_grid(model, (x_min, x_max), (y_min, y_max), target_pixels, levels)
+        if key is not None:
+            _boundary_cache[key] = (xx, yy, Z)
+            if len(_boundary_cache) > 8:
+                del _boundary_cache[next(iter(_boundary_cache))]
     # Plot the contour and training examples
     plt.contourf(xx, yy, Z, cmap=plt.cm.Spectral)
     plt.ylabel('x2')
@@ -325,6 +656,8 @@ def plot_decision_boundary(model, X, y):
     plt.show()
     
 def load_2D_dataset():
+    import scipy.io
+    import matplotlib.pyplot as plt
     data = scipy.io.loadmat('datasets/data.mat')
     train_X = data['X'].T
     train_Y = data['y'].T
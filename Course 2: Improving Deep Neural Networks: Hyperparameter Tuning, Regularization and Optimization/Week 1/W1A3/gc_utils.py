@@ -1,3 +1,4 @@
+from multiprocessing import Pool
 import numpy as np
 
 def sigmoid(x):
@@ -27,54 +28,253 @@ def relu(x):
     
     return s
 
-def dictionary_to_vector(parameters):
+def parameters_layout(parameters, keys = None):
+    """
+    Compute once where each parameter lives in the vector of dictionary_to_vector().
+
+    Arguments:
+    parameters -- python dictionary of arrays (parameters or gradients), only their shapes are used
+    keys -- order of the parameters in the vector; by default "W1", "b1", ..., "WL", "bL"
+
+    Returns:
+    layout -- list of (key, offset, shape), in vector order
+    num_parameters -- length of the vector
+    """
+    if keys is None:
+        keys = []
+        for l in range(1, len(parameters) // 2 + 1):
+            keys += ["W" + str(l), "b" + str(l)]
+
+    layout = []
+    offset = 0
+    for key in keys:
+        shape = np.shape(parameters[key])
+        layout.append((key, offset, shape))
+        offset += int(np.prod(shape))
+
+    return layout, offset
+
+# layout of the 5-3-1 network of the Gradient Checking notebook, the default of vector_to_dictionary()
+GRADIENT_CHECK_LAYOUT = [("W1", 0, (5, 4)), ("b1", 20, (5, 1)), ("W2", 25, (3, 5)), ("b2", 40, (3, 1)),
+                         ("W3", 43, (1, 3)), ("b3", 46, (1, 1))]
+
+def dictionary_to_vector(parameters, layout = None):
     """
     Roll all our parameters dictionary into a single vector satisfying our specific required shape.
+
+    The vector is allocated once and each parameter is copied into its slice, in the order of `layout`
+    (by default the one of parameters_layout(parameters)). keys[i] is the name of the parameter theta[i] comes from.
     """
+    if layout is None:
+        layout, num_parameters = parameters_layout(parameters)
+    else:
+        num_parameters = layout[-1][1] + int(np.prod(layout[-1][2]))
+
+    theta = np.empty((num_parameters, 1), dtype=np.result_type(*[parameters[key] for key, _, _ in layout]))
     keys = []
-    count = 0
-    for key in ["W1", "b1", "W2", "b2", "W3", "b3"]:
-        
-        # flatten parameter
-        new_vector = np.reshape(parameters[key], (-1, 1))
-        keys = keys + [key] * new_vector.shape[0]
-        
-        if count == 0:
-            theta = new_vector
-        else:
-            theta = np.concatenate((theta, new_vector), axis=0)
-        count = count + 1
+    for key, offset, shape in layout:
+        size = int(np.prod(shape))
+        theta[offset : offset + size, 0] = np.reshape(parameters[key], -1)
+        keys += [key] * size
 
     return theta, keys
 
-def vector_to_dictionary(theta):
+def vector_to_dictionary(theta, layout = GRADIENT_CHECK_LAYOUT):
     """
     Unroll all our parameters dictionary from a single vector satisfying our specific required shape.
+
+    The parameters are reshaped views into theta, not copies: writing to theta updates them and vice versa.
+    `layout` comes from parameters_layout() and defaults to the 5-3-1 network of the notebook.
     """
     parameters = {}
-    parameters["W1"] = theta[: 20].reshape((5, 4))
-    parameters["b1"] = theta[20: 25].reshape((5, 1))
-    parameters["W2"] = theta[25: 40].reshape((3, 5))
-    parameters["b2"] = theta[40: 43].reshape((3, 1))
-    parameters["W3"] = theta[43: 46].reshape((1, 3))
-    parameters["b3"] = theta[46: 47].reshape((1, 1))
+    for key, offset, shape in layout:
+        parameters[key] = theta[offset : offset + int(np.prod(shape))].reshape(shape)
 
     return parameters
 
-def gradients_to_vector(gradients):
+def gradients_to_vector(gradients, layout = None):
     """
     Roll all our gradients dictionary into a single vector satisfying our specific required shape.
+
+    `layout` is the one of the parameters (keys "W1", "b1", ...); by default it is built from the "dW1", "db1",
+    ... keys present in gradients, ignoring the other entries (dZ1, dA1, ...).
     """
-    
-    count = 0
-    for key in ["dW1", "db1", "dW2", "db2", "dW3", "db3"]:
-        # flatten parameter
-        new_vector = np.reshape(gradients[key], (-1, 1))
-        
-        if count == 0:
-            theta = new_vector
+    if layout is None:
+        L = len([key for key in gradients if key.startswith("dW")])
+        layout, num_parameters = parameters_layout({key: gradients["d" + key] for l in range(1, L + 1)
+                                                    for key in ["W" + str(l), "b" + str(l)]})
+    else:
+        num_parameters = layout[-1][1] + int(np.prod(layout[-1][2]))
+
+    theta = np.empty((num_parameters, 1), dtype=np.result_type(*[gradients["d" + key] for key, _, _ in layout]))
+    for key, offset, shape in layout:
+        theta[offset : offset + int(np.prod(shape)), 0] = np.reshape(gradients["d" + key], -1)
+
+    return theta
+
+def forward_propagation_stacked(A_prev, Y, parameters, start = 1):
+    """
+    Cost of the LINEAR -> RELU -> ... -> LINEAR -> SIGMOID network of forward_propagation_n(), of any depth,
+    for many parameter sets at once. Any parameter may carry a leading batch axis of size B (for example W1 of
+    shape (B, 5, 4)), the others are shared by the whole batch.
+
+    Arguments:
+    A_prev -- activations entering layer `start`, of shape (n, m) or (B, n, m); X when start is 1
+    Y -- true "label" vector, of shape (1, m)
+    parameters -- python dictionary containing "W1", "b1", ..., "WL", "bL", stacked or not
+    start -- index of the first layer to run, the layers before it are summarised by A_prev
+
+    Returns:
+    cost -- logistic cost of each parameter set, of shape (B,), or a float when nothing is stacked
+    """
+    L = len(parameters) // 2
+    m = A_prev.shape[-1]
+    A = A_prev
+    for l in range(start, L + 1):
+        Z = np.matmul(parameters["W" + str(l)], A) + parameters["b" + str(l)]
+        A = relu(Z) if l < L else sigmoid(Z)
+
+    log_probs = np.multiply(-np.log(A), Y) + np.multiply(-np.log(1 - A), 1 - Y)
+    cost = 1. / m * np.sum(log_probs, axis=(-2, -1))
+
+    return cost
+
+def _gradapprox_coordinates(parameters, X, Y, coordinates, epsilon, batch_size):
+    """
+    Two-sided difference quotients of the cost along the given coordinates of the parameter vector.
+
+    The unperturbed forward pass is computed once. Shifting one coordinate of W[l] or b[l] only changes one row
+    of Z[l], so for batch_size coordinates of layer l only those rows are recomputed (as one stacked product for
+    the +epsilon and -epsilon copies), and the layers after l run on the stacked activations.
+    """
+    L = len(parameters) // 2
+    A_prev = [X]
+    WA = []
+    for l in range(1, L + 1):
+        WA.append(np.dot(parameters["W" + str(l)], A_prev[-1]))
+        if l < L:
+            A_prev.append(relu(WA[-1] + parameters["b" + str(l)]))
+
+    gradapprox = np.zeros(len(coordinates))
+    for key, offset, shape in parameters_layout(parameters)[0]:
+        selected = np.flatnonzero((coordinates >= offset) & (coordinates < offset + int(np.prod(shape))))
+        l = int(key[1:])
+        W = parameters["W" + str(l)]
+        b = parameters["b" + str(l)]
+        for start in range(0, len(selected), batch_size):
+            chunk = selected[start : start + batch_size]
+            B = len(chunk)
+            local = coordinates[chunk] - offset
+            # rows 0..B-1 are shifted by +epsilon, rows B..2B-1 by -epsilon
+            shift = np.concatenate([np.full(B, epsilon), np.full(B, -epsilon)])
+
+            if key[0] == "W":
+                rows, cols = np.divmod(np.tile(local, 2), W.shape[1])
+                W_rows = W[rows]
+                W_rows[np.arange(2 * B), cols] = W_rows[np.arange(2 * B), cols] + shift
+                Z_rows = np.dot(W_rows, A_prev[l - 1]) + b[rows]
+            else:
+                rows = np.tile(local, 2)
+                Z_rows = WA[l - 1][rows] + (b[rows, 0] + shift)[:, np.newaxis]
+
+            Z = np.repeat((WA[l - 1] + b)[np.newaxis], 2 * B, axis=0)
+            Z[np.arange(2 * B), rows] = Z_rows
+            A = relu(Z) if l < L else sigmoid(Z)
+            J = forward_propagation_stacked(A, Y, parameters, start=l + 1)
+            gradapprox[chunk] = (J[:B] - J[B:]) / (2 * epsilon)
+
+    return gradapprox
+
+def _gradapprox_directions(parameters, X, Y, directions, epsilon, batch_size):
+    """
+    Two-sided difference quotients of the cost along the rows of `directions`, batch_size directions (all
+    parameters perturbed) per forward pass.
+    """
+    layout = parameters_layout(parameters)[0]
+    gradapprox = np.zeros(directions.shape[0])
+    for start in range(0, directions.shape[0], batch_size):
+        chunk = directions[start : start + batch_size]
+        B = chunk.shape[0]
+        shift = epsilon * np.concatenate([chunk, -chunk], axis=0)
+
+        perturbed = {}
+        for key, offset, shape in layout:
+            perturbed[key] = parameters[key] + shift[:, offset : offset + int(np.prod(shape))].reshape((2 * B,) + shape)
+        J = forward_propagation_stacked(X, Y, perturbed)
+        gradapprox[start : start + B] = (J[:B] - J[B:]) / (2 * epsilon)
+
+    return gradapprox
+
+def _gradapprox_job(job):
+    """
+    Pool worker of gradient_check_batched(): difference quotients for one chunk of coordinates or directions.
+    """
+    parameters, X, Y, kind, chunk, epsilon, batch_size = job
+    if kind == "coordinates":
+        return _gradapprox_coordinates(parameters, X, Y, chunk, epsilon, batch_size)
+    return _gradapprox_directions(parameters, X, Y, chunk, epsilon, batch_size)
+
+def gradient_check_batched(parameters, gradients, X, Y, epsilon = 1e-7, batch_size = 64, num_coordinates = None,
+                           num_directions = 0, seed = 0, n_jobs = 1, print_msg = False):
+    """
+    Same check as gradient_check_n(), for the LINEAR -> RELU -> ... -> LINEAR -> SIGMOID network of
+    forward_propagation_n() of any depth, with many perturbed parameter sets evaluated per forward pass.
+
+    By default every coordinate is checked. num_coordinates checks a random subset of the coordinates instead,
+    and num_directions checks random unit directions u instead of coordinates, comparing the difference
+    quotient of the cost along u with the projection grad . u (each direction covers all the parameters at the
+    price of one coordinate). Chunks of coordinates or directions are spread over n_jobs processes.
+
+    Arguments:
+    parameters -- python dictionary containing your parameters "W1", "b1", ..., "WL", "bL"
+    gradients -- output of backward_propagation_n, contains gradients of the cost with respect to the parameters
+    X -- input datapoint, of shape (input size, number of examples)
+    Y -- true "label"
+    epsilon -- tiny shift to the input to compute approximated gradient with formula(1)
+    batch_size -- number of perturbed parameter sets per forward pass (each stacked twice, for +/- epsilon)
+    num_coordinates -- size of the random subset of coordinates to check, None to check all of them
+    num_directions -- number of random directions to check, 0 to check coordinates
+    seed -- seed of the random subset or directions
+    n_jobs -- number of worker processes, 1 to compute everything in this process
+    print_msg -- print whether the check passed, as gradient_check_n() does
+
+    Returns:
+    difference -- difference (2) between the approximated gradient and the backward propagation gradient,
+                  restricted to the checked coordinates or directions
+    """
+    layout, num_parameters = parameters_layout(parameters)
+    grad = gradients_to_vector(gradients, layout)[:, 0]
+
+    np.random.seed(seed)
+    if num_directions > 0:
+        kind = "directions"
+        items = np.random.randn(num_directions, num_parameters)
+        items /= np.linalg.norm(items, axis=1, keepdims=True)
+        grad = np.dot(items, grad)
+    else:
+        kind = "coordinates"
+        if num_coordinates is None or num_coordinates >= num_parameters:
+            items = np.arange(num_parameters)
+        else:
+            items = np.sort(np.random.choice(num_parameters, num_coordinates, replace=False))
+        grad = grad[items]
+
+    if n_jobs > 1:
+        chunks = np.array_split(items, min(4 * n_jobs, len(items)))
+        jobs = [(parameters, X, Y, kind, chunk, epsilon, batch_size) for chunk in chunks]
+        with Pool(n_jobs) as pool:
+            gradapprox = np.concatenate(pool.map(_gradapprox_job, jobs))
+    else:
+        gradapprox = _gradapprox_job((parameters, X, Y, kind, items, epsilon, batch_size))
+
+    numerator = np.linalg.norm(grad - gradapprox)
+    denominator = np.linalg.norm(grad) + np.linalg.norm(gradapprox)
+    difference = numerator / denominator
+
+    if print_msg:
+        if difference > 2e-7:
+            print ("\033[93m" + "There is a mistake in the backward propagation! difference = " + str(difference) + "\033[0m")
         else:
-            theta = np.concatenate((theta, new_vector), axis=0)
-        count = count + 1
+            print ("\033[92m" + "Your backward propagation works perfectly fine! difference = " + str(difference) + "\033[0m")
 
-    return theta
\ No newline at end of file
+    return difference
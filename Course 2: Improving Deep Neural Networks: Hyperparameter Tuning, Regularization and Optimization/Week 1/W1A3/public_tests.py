@@ -83,3 +83,43 @@ def predict_test(target):
     single_test(test_cases, target)
 
     
+
+def gradient_check_batched_test(target):
+    from testCases import gradient_check_n_test_case
+    from gc_utils import dictionary_to_vector, vector_to_dictionary, gradients_to_vector, forward_propagation_stacked
+    
+    X, Y, parameters = gradient_check_n_test_case()
+    epsilon = 1e-7
+    
+    # Looped reference, as in gradient_check_n(): one coordinate and two forward passes at a time
+    parameters_values, _ = dictionary_to_vector(parameters)
+    gradapprox = np.zeros(parameters_values.shape)
+    for i in range(parameters_values.shape[0]):
+        theta_plus = np.copy(parameters_values)
+        theta_plus[i] = theta_plus[i] + epsilon
+        theta_minus = np.copy(parameters_values)
+        theta_minus[i] = theta_minus[i] - epsilon
+        J_plus = forward_propagation_stacked(X, Y, vector_to_dictionary(theta_plus))
+        J_minus = forward_propagation_stacked(X, Y, vector_to_dictionary(theta_minus))
+        gradapprox[i] = (J_plus - J_minus) / (2 * epsilon)
+    
+    np.random.seed(4)
+    exact = {"d" + key: value for key, value in vector_to_dictionary(gradapprox).items()}
+    wrong = {"d" + key: value for key, value in vector_to_dictionary(gradapprox + 1e-3 * np.random.randn(*gradapprox.shape)).items()}
+    
+    for gradients in [exact, wrong]:
+        grad = gradients_to_vector(gradients)
+        expected = np.linalg.norm(grad - gradapprox) / (np.linalg.norm(grad) + np.linalg.norm(gradapprox))
+        for batch_size in [1, 7, 64]:
+            difference = target(parameters, gradients, X, Y, epsilon=epsilon, batch_size=batch_size)
+            assert np.isclose(difference, expected, rtol=1e-5, atol=1e-9), \
+                "Wrong difference with batch_size={}: {} instead of {}".format(batch_size, difference, expected)
+        assert np.isclose(target(parameters, gradients, X, Y, epsilon=epsilon, n_jobs=2), expected, rtol=1e-5, atol=1e-9), \
+            "Wrong difference with n_jobs=2"
+    
+    assert target(parameters, exact, X, Y, epsilon=epsilon, num_directions=10) < 2e-7, \
+        "The directional check must pass for the exact gradient"
+    assert target(parameters, wrong, X, Y, epsilon=epsilon, num_directions=10) > 2e-7, \
+        "The directional check must catch a wrong gradient"
+    
+    print("\033[92m All tests passed.")
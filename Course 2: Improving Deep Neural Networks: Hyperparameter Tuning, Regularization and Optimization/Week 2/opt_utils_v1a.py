@@ -1,9 +1,8 @@
+import hashlib
+import math
+import queue
+import threading
 import numpy as np
-import matplotlib.pyplot as plt
-import h5py
-import scipy.io
-import sklearn
-import sklearn.datasets
 
 def sigmoid(x):
     """
@@ -208,7 +207,256 @@ def predict(X, y, parameters):
     
     return p
 
+def iter_mini_batches(X, Y, mini_batch_size = 64, seed = 0, prefetch = 2):
+    """
+    Lazily yields the same (mini_batch_X, mini_batch_Y) pairs as the notebook's
+    random_mini_batches(X, Y, mini_batch_size, seed), without building the shuffled copy of X or the list of all
+    mini-batches. Only the permutation is kept; each mini-batch is gathered on demand into a preallocated buffer,
+    and a background thread prepares the next `prefetch` mini-batches while the current one is being used.
+
+    The buffers are reused: a yielded mini-batch is only valid until the next one is requested, so copy it
+    if it has to be kept.
+
+    Arguments:
+    X -- input data, of shape (input size, number of examples)
+    Y -- true "label" vector, of shape (n_y, number of examples)
+    mini_batch_size -- size of the mini-batches, integer
+    seed -- seed of the shuffle, same meaning as in the notebook's random_mini_batches()
+    prefetch -- number of mini-batches gathered ahead by the background thread, 0 to gather in the caller
+
+    Yields:
+    mini_batch -- synchronous (mini_batch_X, mini_batch_Y)
+    """
+
+    m = X.shape[1]                  # number of training examples
+    np.random.seed(seed)
+    permutation = np.random.permutation(m)
+    num_minibatches = int(math.ceil(m / mini_batch_size))
+    size = min(mini_batch_size, m)
+
+    # prefetch batches waiting in the queue, one being filled and one held by the caller
+    n_buffers = prefetch + 2 if prefetch > 0 else 1
+    buffers = [(np.empty((X.shape[0], size), dtype = X.dtype), np.empty((Y.shape[0], size), dtype = Y.dtype))
+               for _ in range(n_buffers)]
+
+    def gather(k):
+        idx = permutation[k * mini_batch_size : (k + 1) * mini_batch_size]
+        buffer_X, buffer_Y = buffers[k % n_buffers]
+        mini_batch_X = buffer_X[:, :len(idx)]
+        mini_batch_Y = buffer_Y[:, :len(idx)]
+        # indices come from a permutation, so mode="clip" only skips the bounds check (and the extra copy it makes)
+        np.take(X, idx, axis = 1, out = mini_batch_X, mode = "clip")
+        np.take(Y, idx, axis = 1, out = mini_batch_Y, mode = "clip")
+        return mini_batch_X, mini_batch_Y
+
+    if prefetch <= 0:
+        for k in range(num_minibatches):
+            yield gather(k)
+        return
+
+    batches = queue.Queue(maxsize = prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # give up as soon as the caller stops iterating, so the thread never blocks on a full queue
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for k in range(num_minibatches):
+                if not put(gather(k)):
+                    return
+        except BaseException as error:
+            put(error)
+
+    thread = threading.Thread(target = producer, daemon = True)
+    thread.start()
+    try:
+        for k in range(num_minibatches):
+            item = batches.get()
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def initialize_optimizer_flat(parameters, optimizer = "adam"):
+    """
+    Move the parameters into one contiguous buffer and allocate the optimizer state as buffers of the
+    same size, for update_parameters_with_momentum_flat() and update_parameters_with_adam_flat().
+    
+    Arguments:
+    parameters -- python dictionary containing your parameters "W1", "b1", ..., "WL", "bL"
+    optimizer -- "momentum" or "adam"
+    
+    Returns:
+    parameters -- python dictionary with the same keys and values, now views into state["theta"]
+    state -- python dictionary containing:
+                    keys -- the parameter names, in buffer order
+                    theta -- flat buffer of the parameters
+                    grads -- flat buffer the gradients are gathered into at each step
+                    v -- velocity, or moving average of the gradient, initialized with zeros
+                    s -- moving average of the squared gradient, initialized with zeros ("adam" only)
+                    tmp, tmp2 -- scratch buffers
+    """
+    
+    keys = list(parameters.keys())
+    theta = np.concatenate([parameters[key].ravel() for key in keys])
+    
+    views = {}
+    offset = 0
+    for key in keys:
+        shape = parameters[key].shape
+        views[key] = theta[offset:offset + parameters[key].size].reshape(shape)
+        offset += parameters[key].size
+    
+    state = {"keys": keys,
+             "theta": theta,
+             "grads": np.zeros_like(theta),
+             "v": np.zeros_like(theta),
+             "tmp": np.zeros_like(theta)}
+    if optimizer == "adam":
+        state["s"] = np.zeros_like(theta)
+        state["tmp2"] = np.zeros_like(theta)
+    
+    return views, state
+
+def update_parameters_with_momentum_flat(parameters, grads, state, beta, learning_rate):
+    """
+    update_parameters_with_momentum() on the flat buffers of initialize_optimizer_flat(): the same operations
+    in the same order, so the same results, but applied in place to all the layers at once.
+    
+    Arguments:
+    parameters -- the parameters returned by initialize_optimizer_flat()
+    grads -- python dictionary containing your gradients, grads['dW' + str(l)] = dWl, grads['db' + str(l)] = dbl
+    state -- the state returned by initialize_optimizer_flat(parameters, "momentum"), updated in place
+    beta -- the momentum hyperparameter, scalar
+    learning_rate -- the learning rate, scalar
+    
+    Returns:
+    parameters -- the same dictionary, whose arrays were updated in place
+    """
+    theta, g, v, tmp = state["theta"], state["grads"], state["v"], state["tmp"]
+    np.concatenate([grads["d" + key].ravel() for key in state["keys"]], out=g)
+    
+    # v = beta * v + (1 - beta) * g
+    np.multiply(v, beta, out=v)
+    np.multiply(g, 1 - beta, out=tmp)
+    np.add(v, tmp, out=v)
+    
+    # theta = theta - learning_rate * v
+    np.multiply(v, learning_rate, out=tmp)
+    np.subtract(theta, tmp, out=theta)
+    
+    return parameters
+
+def update_parameters_with_adam_flat(parameters, grads, state, t, learning_rate = 0.01,
+                                     beta1 = 0.9, beta2 = 0.999,  epsilon = 1e-8):
+    """
+    update_parameters_with_adam() on the flat buffers of initialize_optimizer_flat(): the same operations
+    in the same order, so the same results, but applied in place to all the layers at once instead of
+    building about ten temporary arrays per parameter.
+    
+    Arguments:
+    parameters -- the parameters returned by initialize_optimizer_flat()
+    grads -- python dictionary containing your gradients, grads['dW' + str(l)] = dWl, grads['db' + str(l)] = dbl
+    state -- the state returned by initialize_optimizer_flat(parameters, "adam"), updated in place
+    t -- Adam variable, counts the number of taken steps
+    learning_rate -- the learning rate, scalar.
+    beta1 -- Exponential decay hyperparameter for the first moment estimates 
+    beta2 -- Exponential decay hyperparameter for the second moment estimates 
+    epsilon -- hyperparameter preventing division by zero in Adam updates
+    
+    Returns:
+    parameters -- the same dictionary, whose arrays were updated in place
+    """
+    theta, g, v, s, tmp, tmp2 = state["theta"], state["grads"], state["v"], state["s"], state["tmp"], state["tmp2"]
+    np.concatenate([grads["d" + key].ravel() for key in state["keys"]], out=g)
+    
+    # v = beta1 * v + (1 - beta1) * g
+    np.multiply(v, beta1, out=v)
+    np.multiply(g, 1 - beta1, out=tmp)
+    np.add(v, tmp, out=v)
+    
+    # s = beta2 * s + (1 - beta2) * g ** 2
+    np.multiply(s, beta2, out=s)
+    np.square(g, out=tmp)
+    np.multiply(tmp, 1 - beta2, out=tmp)
+    np.add(s, tmp, out=s)
+    
+    # theta = theta - learning_rate * (v_corrected / (sqrt(s_corrected) + epsilon))
+    np.divide(s, 1 - beta2 ** t, out=tmp)
+    np.sqrt(tmp, out=tmp)
+    np.add(tmp, epsilon, out=tmp)
+    np.divide(v, 1 - beta1 ** t, out=tmp2)
+    np.divide(tmp2, tmp, out=tmp2)
+    np.multiply(tmp2, learning_rate, out=tmp2)
+    np.subtract(theta, tmp2, out=theta)
+    
+    return parameters
+
+def benchmark_optimizer_flat(layers_dims, update_parameters_with_adam, update_parameters_with_momentum = None, num_steps = 100):
+    """
+    Time the per-step cost of the notebook's dictionary-based updates against the flat ones on random
+    parameters and gradients of the given shapes, checking on the way that both give the same parameters.
+    
+    Arguments:
+    layers_dims -- python list, containing the size of each layer, e.g. [2] + [64] * 20 + [1]
+    update_parameters_with_adam -- the notebook's update_parameters_with_adam()
+    update_parameters_with_momentum -- the notebook's update_parameters_with_momentum(), or None
+    num_steps -- number of timed steps per optimizer
+    
+    Returns:
+    timings -- python dictionary mapping "adam" and "momentum" to the (dictionary, flat) times per step in seconds
+    """
+    import time
+    
+    np.random.seed(3)
+    parameters = initialize_parameters(layers_dims)
+    grads = {"d" + key: np.random.randn(*value.shape) for key, value in parameters.items()}
+    
+    timings = {}
+    for optimizer, update in [("adam", update_parameters_with_adam), ("momentum", update_parameters_with_momentum)]:
+        if update is None:
+            continue
+        
+        reference = {key: value.copy() for key, value in parameters.items()}
+        v = {"d" + key: np.zeros(value.shape) for key, value in parameters.items()}
+        s = {"d" + key: np.zeros(value.shape) for key, value in parameters.items()}
+        start = time.perf_counter()
+        for t in range(1, num_steps + 1):
+            if optimizer == "adam":
+                reference, v, s = update(reference, grads, v, s, t)[:3]
+            else:
+                reference, v = update(reference, grads, v, 0.9, 0.01)
+        dictionary_seconds = (time.perf_counter() - start) / num_steps
+        
+        flat, state = initialize_optimizer_flat(parameters, optimizer)
+        start = time.perf_counter()
+        for t in range(1, num_steps + 1):
+            if optimizer == "adam":
+                flat = update_parameters_with_adam_flat(flat, grads, state, t)
+            else:
+                flat = update_parameters_with_momentum_flat(flat, grads, state, 0.9, 0.01)
+        flat_seconds = (time.perf_counter() - start) / num_steps
+        
+        identical = all(np.array_equal(reference[key], flat[key]) for key in parameters)
+        timings[optimizer] = (dictionary_seconds, flat_seconds)
+        print("{:<9} dictionary {:8.1f} us/step   flat {:8.1f} us/step   speedup x{:.2f}   identical: {}".format(
+            optimizer, 1e6 * dictionary_seconds, 1e6 * flat_seconds, dictionary_seconds / flat_seconds, identical))
+    
+    return timings
+
 def load_2D_dataset():
+    import scipy.io
+    import matplotlib.pyplot as plt
     data = scipy.io.loadmat('datasets/data.mat')
     train_X = data['X'].T
     train_Y = data['y'].T
@@ -219,16 +467,115 @@ def load_2D_dataset():
     
     return train_X, train_Y, test_X, test_Y
 
-def plot_decision_boundary(model, X, y):
+_boundary_cache = {}
+
+def parameters_hash(parameters):
+    """
+    Hash the values of a parameters dictionary (or of a single array), used as the decision boundary cache key.
+    
+    Arguments:
+    parameters -- python dictionary of numpy arrays, or a numpy array
+    
+    Returns:
+    digest -- hexadecimal SHA-1 digest of the keys, dtypes, shapes and values
+    """
+    digest = hashlib.sha1()
+    items = sorted(parameters.items()) if isinstance(parameters, dict) else [("", parameters)]
+    for key, value in items:
+        value = np.ascontiguousarray(value)
+        digest.update(str((key, value.dtype.str, value.shape)).encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+def _evaluate_points(model, px, py, tile_size):
+    """
+    Evaluate model on the points (px[i], py[i]), tile_size points per call.
+    """
+    values = np.empty(px.size)
+    for start in range(0, px.size, tile_size):
+        stop = start + tile_size
+        values[start:stop] = np.ravel(model(np.c_[px[start:stop], py[start:stop]]))
+    return values
+
+def decision_boundary_grid(model, x_range, y_range, target_pixels = 250000, levels = 4, threshold = 0.5, tile_size = 65536):
+    """
+    Evaluate model on a regular grid of about target_pixels points covering x_range by y_range.
+    
+    The model is first evaluated on every 2**levels-th grid point. Each level then halves the spacing, and only
+    the cells whose corners straddle threshold are evaluated at the new points (adaptive quadtree); the other
+    cells are filled by interpolating their corners, which is exact for the 0/1 labels returned by the usual
+    predict functions. Decision regions narrower than a coarse cell can therefore be missed.
+    
+    Arguments:
+    model -- function mapping an (n, 2) array of points to n outputs
+    x_range -- (x_min, x_max)
+    y_range -- (y_min, y_max)
+    target_pixels -- approximate number of grid points, sets the resolution
+    levels -- number of refinement levels
+    threshold -- decision threshold on the model output
+    tile_size -- maximum number of points passed to model in a single call
+    
+    Returns:
+    xx, yy -- grid coordinates, as returned by np.meshgrid
+    Z -- model output on the grid, same shape as xx
+    """
+    x_min, x_max = x_range
+    y_min, y_max = y_range
+    step = np.sqrt((x_max - x_min) * (y_max - y_min) / target_pixels)
+    s = 2 ** levels
+    xs = np.linspace(x_min, x_max, max(1, int(np.ceil((x_max - x_min) / (step * s)))) * s + 1)
+    ys = np.linspace(y_min, y_max, max(1, int(np.ceil((y_max - y_min) / (step * s)))) * s + 1)
+    Z = np.empty((ys.size, xs.size))
+    
+    # Coarsest level: evaluate every s-th point
+    iy, ix = np.meshgrid(np.arange(0, ys.size, s), np.arange(0, xs.size, s), indexing = 'ij')
+    Z[::s, ::s] = _evaluate_points(model, xs[ix.ravel()], ys[iy.ravel()], tile_size).reshape(ix.shape)
+    
+    while s > 1:
+        h = s // 2
+        G = Z[::h, ::h]                       # view of the grid at the new spacing, known points at even indices
+        C = G[::2, ::2]
+        corners = np.stack([C[:-1, :-1], C[:-1, 1:], C[1:, :-1], C[1:, 1:]])
+        refine = (corners.min(axis = 0) <= threshold) & (corners.max(axis = 0) > threshold)
+        
+        # Interpolate the new points, then evaluate those of the cells that straddle the threshold
+        G[1::2, ::2] = (C[:-1, :] + C[1:, :]) / 2
+        G[::2, 1::2] = (C[:, :-1] + C[:, 1:]) / 2
+        G[1::2, 1::2] = corners.mean(axis = 0)
+        evaluate = np.zeros(G.shape, dtype = bool)
+        ci, cj = np.nonzero(refine)
+        for di, dj in ((1, 1), (0, 1), (2, 1), (1, 0), (1, 2)):
+            evaluate[2 * ci + di, 2 * cj + dj] = True
+        gi, gj = np.nonzero(evaluate)
+        G[gi, gj] = _evaluate_points(model, xs[gj * h], ys[gi * h], tile_size)
+        s = h
+    
+    xx, yy = np.meshgrid(xs, ys)
+    return xx, yy, Z
+
+def plot_decision_boundary(model, X, y, parameters = None, target_pixels = 250000, levels = 4):
+    """
+    Plot the decision regions of model over the data range, see decision_boundary_grid().
+    
+    Passing the parameters the model was built from caches the grid under their hash and the plotting
+    range, so re-plotting the same model is free.
+    """
+    import matplotlib.pyplot as plt
     # Set min and max values and give it some padding
     x_min, x_max = X[0, :].min() - 1, X[0, :].max() + 1
     y_min, y_max = X[1, :].min() - 1, X[1, :].max() + 1
-    h = 0.01
-    # Generate a grid of points with distance h between them
-    xx, yy = np.meshgrid(np.arange(x_min, x_max, h), np.arange(y_min, y_max, h))
-    # Predict the function value for the whole grid
-    Z = model(np.c_[xx.ravel(), yy.ravel()])
-    Z = Z.reshape(xx.shape)
+    key = None
+    if parameters is not None:
+        key = (parameters_hash(parameters), x_min, x_max, y_min, y_max, target_pixels, levels)
+    if key is not None and key in _boundary_cache:
+        xx, yy, Z = _boundary_cache[key]
+    else:
+        # Predict the function value on the grid, refining only around the boundary
+        xx, yy, Z = decision_boundary_grid(model, (x_min, x_max), (y_min, y_max), target_pixels, levels)
+        if key is not None:
+            _boundary_cache[key] = (xx, yy, Z)
+            if len(_boundary_cache) > 8:
+                del _boundary_cache[next(iter(_boundary_cache))]
     # Plot the contour and training examples
     plt.contourf(xx, yy, Z, cmap=plt.cm.Spectral)
     plt.ylabel('x2')
@@ -254,6 +601,8 @@ def predict_dec(parameters, X):
     return predictions
 
 def load_dataset():
+    import sklearn.datasets
+    import matplotlib.pyplot as plt
     np.random.seed(3)
     train_X, train_Y = sklearn.datasets.make_moons(n_samples=300, noise=.2) #300 #0.2 
     # Visualize the data
@@ -1,4 +1,6 @@
 import math
+import queue
+import threading
 import numpy as np
 import h5py
 import matplotlib.pyplot as plt
@@ -73,6 +75,89 @@ def random_mini_batches(X, Y, mini_batch_size=64, seed=0):
     return mini_batches
 
 
+def iter_mini_batches(X, Y, mini_batch_size=64, seed=0, prefetch=2):
+    """
+    Lazily yields the same (mini_batch_X, mini_batch_Y) pairs as random_mini_batches(X, Y, mini_batch_size, seed),
+    without building the shuffled copy of X or the list of all mini-batches. Only the permutation is kept; each
+    mini-batch is gathered on demand into a preallocated buffer, and a background thread prepares the next
+    `prefetch` mini-batches while the current one is being used.
+
+    The buffers are reused: a yielded mini-batch is only valid until the next one is requested, so copy it
+    if it has to be kept.
+
+    Arguments:
+    X -- input data, of shape (m, Hi, Wi, Ci)
+    Y -- true "label" vector, of shape (m, n_y)
+    mini_batch_size -- size of the mini-batches, integer
+    seed -- seed of the shuffle, same meaning as in random_mini_batches()
+    prefetch -- number of mini-batches gathered ahead by the background thread, 0 to gather in the caller
+
+    Yields:
+    mini_batch -- synchronous (mini_batch_X, mini_batch_Y)
+    """
+
+    m = X.shape[0]                  # number of training examples
+    np.random.seed(seed)
+    permutation = np.random.permutation(m)
+    num_minibatches = int(math.ceil(m / mini_batch_size))
+    size = min(mini_batch_size, m)
+
+    # prefetch batches waiting in the queue, one being filled and one held by the caller
+    n_buffers = prefetch + 2 if prefetch > 0 else 1
+    buffers = [(np.empty((size,) + X.shape[1:], dtype=X.dtype),
+                np.empty((size,) + Y.shape[1:], dtype=Y.dtype))
+               for _ in range(n_buffers)]
+
+    def gather(k):
+        idx = permutation[k * mini_batch_size: (k + 1) * mini_batch_size]
+        buffer_X, buffer_Y = buffers[k % n_buffers]
+        mini_batch_X = buffer_X[:len(idx)]
+        mini_batch_Y = buffer_Y[:len(idx)]
+        # indices come from a permutation, so mode="clip" only skips the bounds check (and the extra copy it makes)
+        np.take(X, idx, axis=0, out=mini_batch_X, mode="clip")
+        np.take(Y, idx, axis=0, out=mini_batch_Y, mode="clip")
+        return mini_batch_X, mini_batch_Y
+
+    if prefetch <= 0:
+        for k in range(num_minibatches):
+            yield gather(k)
+        return
+
+    batches = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # give up as soon as the caller stops iterating, so the thread never blocks on a full queue
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for k in range(num_minibatches):
+                if not put(gather(k)):
+                    return
+        except BaseException as error:
+            put(error)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        for k in range(num_minibatches):
+            item = batches.get()
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+
 def convert_to_one_hot(Y, C):
     Y = np.eye(C)[Y.reshape(-1)].T
     return Y
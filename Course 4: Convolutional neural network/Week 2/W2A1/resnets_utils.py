@@ -1,8 +1,13 @@
 import os
+import hashlib
+import shutil
+import tempfile
 import numpy as np
 import tensorflow as tf
 import h5py
 import math
+import queue
+import threading
 
 from keras.layers import Layer
 
@@ -137,11 +142,213 @@ def random_mini_batches(X, Y, mini_batch_size=64, seed=0):
     return mini_batches
 
 
+def iter_mini_batches(X, Y, mini_batch_size=64, seed=0, prefetch=2):
+    """
+    Lazily yields the same (mini_batch_X, mini_batch_Y) pairs as random_mini_batches(X, Y, mini_batch_size, seed),
+    without building the shuffled copy of X or the list of all mini-batches. Only the permutation is kept; each
+    mini-batch is gathered on demand into a preallocated buffer, and a background thread prepares the next
+    `prefetch` mini-batches while the current one is being used.
+
+    The buffers are reused: a yielded mini-batch is only valid until the next one is requested, so copy it
+    if it has to be kept.
+
+    Arguments:
+    X -- input data, of shape (m, Hi, Wi, Ci)
+    Y -- true "label" vector, of shape (m, n_y)
+    mini_batch_size -- size of the mini-batches, integer
+    seed -- seed of the shuffle, same meaning as in random_mini_batches()
+    prefetch -- number of mini-batches gathered ahead by the background thread, 0 to gather in the caller
+
+    Yields:
+    mini_batch -- synchronous (mini_batch_X, mini_batch_Y)
+    """
+
+    m = X.shape[0]                  # number of training examples
+    np.random.seed(seed)
+    permutation = np.random.permutation(m)
+    num_minibatches = int(math.ceil(m / mini_batch_size))
+    size = min(mini_batch_size, m)
+
+    # prefetch batches waiting in the queue, one being filled and one held by the caller
+    n_buffers = prefetch + 2 if prefetch > 0 else 1
+    buffers = [(np.empty((size,) + X.shape[1:], dtype=X.dtype),
+                np.empty((size,) + Y.shape[1:], dtype=Y.dtype))
+               for _ in range(n_buffers)]
+
+    def gather(k):
+        idx = permutation[k * mini_batch_size: (k + 1) * mini_batch_size]
+        buffer_X, buffer_Y = buffers[k % n_buffers]
+        mini_batch_X = buffer_X[:len(idx)]
+        mini_batch_Y = buffer_Y[:len(idx)]
+        # indices come from a permutation, so mode="clip" only skips the bounds check (and the extra copy it makes)
+        np.take(X, idx, axis=0, out=mini_batch_X, mode="clip")
+        np.take(Y, idx, axis=0, out=mini_batch_Y, mode="clip")
+        return mini_batch_X, mini_batch_Y
+
+    if prefetch <= 0:
+        for k in range(num_minibatches):
+            yield gather(k)
+        return
+
+    batches = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # give up as soon as the caller stops iterating, so the thread never blocks on a full queue
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for k in range(num_minibatches):
+                if not put(gather(k)):
+                    return
+        except BaseException as error:
+            put(error)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        for k in range(num_minibatches):
+            item = batches.get()
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+
 def convert_to_one_hot(Y, C):
     Y = np.eye(C)[Y.reshape(-1)].T
     return Y
 
 
+def _file_digest(path, cache_dir):
+    """
+    SHA-1 of the content of a file, remembered in cache_dir under its (path, size, mtime) so that an
+    unchanged file is hashed only once.
+    """
+    stat = os.stat(path)
+    stamp = "{}:{}:{}".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    stamp_path = os.path.join(cache_dir, hashlib.sha1(stamp.encode()).hexdigest() + ".digest")
+    
+    if os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            return f.read()
+    
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    
+    with open(stamp_path, "w") as f:
+        f.write(digest.hexdigest())
+    
+    return digest.hexdigest()
+
+def cached_arrays(name, sources, params, build, cache_dir = "datasets/cache"):
+    """
+    Return the arrays computed by build() from an on-disk .npy cache, as read-only memory maps.
+    
+    The cache entry is keyed by the content hash of the source files and by the transform parameters,
+    so it is rebuilt only when one of them changes. Loading an existing entry only maps the files:
+    it does not decode anything, and processes mapping the same entry share its pages.
+    
+    Arguments:
+    name -- short name of the dataset, used in the name of the cache entry
+    sources -- list of paths of the files read by build()
+    params -- python dictionary of the transform parameters build() depends on
+    build -- function without arguments returning a python dictionary of numpy arrays
+    cache_dir -- directory holding the cache entries
+    
+    Returns:
+    arrays -- python dictionary with the keys returned by build(), whose values are np.memmap
+    """
+    
+    os.makedirs(cache_dir, exist_ok = True)
+    
+    key = hashlib.sha1()
+    for path in sources:
+        key.update(_file_digest(path, cache_dir).encode())
+    key.update(repr(sorted(params.items())).encode())
+    entry = os.path.join(cache_dir, name + "-" + key.hexdigest()[:16])
+    
+    if not os.path.isdir(entry):
+        # Write into a private directory and rename it, so concurrent loaders never see a partial entry
+        tmp = tempfile.mkdtemp(dir = cache_dir)
+        for array_name, array in build().items():
+            # View through a plain dtype to drop the h5py string metadata, which .npy cannot store
+            np.save(os.path.join(tmp, array_name + ".npy"), array.view(np.dtype(array.dtype.str)))
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp)        # another process created the entry first
+    
+    return {file_name[:-4]: np.load(os.path.join(entry, file_name), mmap_mode = "r")
+            for file_name in os.listdir(entry) if file_name.endswith(".npy")}
+
+def _preprocess_images(X_orig, Y_orig, num_classes, flatten, one_hot, dtype):
+    """
+    Turn raw uint8 images and labels into ready-to-train arrays.
+    
+    Arguments:
+    X_orig -- images of shape (number of examples, num_px, num_px, 3)
+    Y_orig -- labels of shape (1, number of examples)
+    num_classes -- number of classes, used for the one-hot encoding
+    flatten -- if True, examples are columns (X of shape (num_px * num_px * 3, m), Y of shape (C, m) or (1, m));
+               if False, examples are rows (X of shape (m, num_px, num_px, 3), Y of shape (m, C) or (m, 1))
+    one_hot -- if True, Y is one-hot encoded with convert_to_one_hot()
+    dtype -- floating point type of X (and of Y when one-hot encoded)
+    
+    Returns:
+    X, Y -- preprocessed arrays, X scaled to [0, 1]
+    """
+    
+    Y = convert_to_one_hot(Y_orig, num_classes).astype(dtype) if one_hot else Y_orig
+    
+    if flatten:
+        X = X_orig.reshape(X_orig.shape[0], -1).T.astype(dtype)
+    else:
+        X = X_orig.astype(dtype)
+        Y = Y.T
+    X /= 255.
+    
+    return X, Y
+
+def load_dataset_cached(flatten = False, one_hot = True, dtype = np.float32, cache_dir = "datasets/cache"):
+    """
+    Cached, memory-mapped version of load_dataset() returning the preprocessed SIGNS arrays.
+    The first call decodes the HDF5 files and writes the .npy cache, later calls only map it.
+    
+    Arguments:
+    flatten, one_hot, dtype -- preprocessing options, see _preprocess_images()
+    cache_dir -- directory holding the cache entries
+    
+    Returns:
+    train_set_x, train_set_y, test_set_x, test_set_y, classes -- read-only np.memmap arrays
+    """
+    
+    def build():
+        train_set_x_orig, train_set_y_orig, test_set_x_orig, test_set_y_orig, classes = load_dataset()
+        num_classes = len(classes)
+        train_set_x, train_set_y = _preprocess_images(train_set_x_orig, train_set_y_orig, num_classes, flatten, one_hot, dtype)
+        test_set_x, test_set_y = _preprocess_images(test_set_x_orig, test_set_y_orig, num_classes, flatten, one_hot, dtype)
+        return {"train_set_x": train_set_x, "train_set_y": train_set_y,
+                "test_set_x": test_set_x, "test_set_y": test_set_y, "classes": classes}
+    
+    params = {"flatten": flatten, "one_hot": one_hot, "dtype": np.dtype(dtype).str}
+    arrays = cached_arrays("signs", ['datasets/train_signs.h5', 'datasets/test_signs.h5'], params, build, cache_dir)
+    
+    return arrays["train_set_x"], arrays["train_set_y"], arrays["test_set_x"], arrays["test_set_y"], arrays["classes"]
+
+
 def forward_propagation_for_predict(X, parameters):
     """
     Implements the forward propagation for the model: LINEAR -> RELU -> LINEAR -> RELU -> LINEAR -> SOFTMAX
@@ -175,28 +382,62 @@ def forward_propagation_for_predict(X, parameters):
     return Z3
 
 
-def predict(X, parameters):
+# traced predictors kept by predict(), one per set of parameter shapes
+_predictors = {}
+
 
-    W1 = tf.convert_to_tensor(parameters["W1"])
-    b1 = tf.convert_to_tensor(parameters["b1"])
-    W2 = tf.convert_to_tensor(parameters["W2"])
-    b2 = tf.convert_to_tensor(parameters["b2"])
-    W3 = tf.convert_to_tensor(parameters["W3"])
-    b3 = tf.convert_to_tensor(parameters["b3"])
+def make_predictor(parameters, forward=None):
+    """
+    Trace the forward propagation once as a tf.function that predicts the classes of any number of examples.
+
+    The parameters are copied into non-trainable tf.Variables captured by the graph, so assigning new values
+    to them reuses the same traced graph.
 
-    params = {"W1": W1,
-              "b1": b1,
-              "W2": W2,
-              "b2": b2,
-              "W3": W3,
-              "b3": b3}
+    Arguments:
+    parameters -- python dictionary containing your parameters "W1", "b1", "W2", "b2", "W3", "b3"
+    forward -- function (X, parameters) -> Z3 to trace, forward_propagation_for_predict by default
 
-    x = tf.placeholder("float", [12288, 1])
+    Returns:
+    predictor -- tf.function mapping X of shape (input size, number of examples) to the predicted classes,
+                 of shape (number of examples,)
+    variables -- python dictionary of the tf.Variables the predictor reads the parameters from
+    """
+    if forward is None:
+        forward = forward_propagation_for_predict
+    variables = {key: tf.Variable(tf.cast(value, tf.float32), trainable=False)
+                 for key, value in parameters.items()}
+    n_x = variables["W1"].shape[1]
 
-    z3 = forward_propagation_for_predict(x, params)
-    p = tf.argmax(z3)
+    @tf.function(input_signature=[tf.TensorSpec(shape=[n_x, None], dtype=tf.float32)])
+    def predictor(X):
+        return tf.argmax(forward(X, variables))
 
-    sess = tf.Session()
-    prediction = sess.run(p, feed_dict={x: X})
+    # trace now, so that the first prediction does not pay for it
+    predictor.get_concrete_function()
+
+    return predictor, variables
+
+
+def predict(X, parameters):
+    """
+    Predict the class of each example, with the predictor of make_predictor() traced on the first call for
+    these parameter shapes and reused by the next calls.
+
+    Arguments:
+    X -- input data, of shape (input size, number of examples)
+    parameters -- python dictionary containing your parameters "W1", "b1", "W2", "b2", "W3", "b3"
+
+    Returns:
+    prediction -- predicted classes, of shape (number of examples,)
+    """
+    signature = tuple(sorted((key, tuple(value.shape))
+                             for key, value in parameters.items()))
+    if signature not in _predictors:
+        _predictors[signature] = make_predictor(parameters)
+    predictor, variables = _predictors[signature]
+
+    for key, value in parameters.items():
+        variables[key].assign(tf.cast(value, tf.float32))
+    prediction = predictor(tf.cast(X, tf.float32)).numpy()
 
     return prediction
@@ -107,4 +107,128 @@ def update_parameters_with_adam(parameters, grads, v, s, t, learning_rate = 0.01
         parameters["b" + str(l+1)] = parameters["b" + str(l+1)] - learning_rate * v_corrected["db" + str(l+1)] / np.sqrt(s_corrected["db" + str(l+1)] + epsilon)
         ### END CODE HERE ###
 
-    return parameters, v, s
\ No newline at end of file
+    return parameters, v, s
+
+
+def initialize_adam_flat(parameters):
+    """
+    Move the parameters into one contiguous buffer and allocate the Adam state as buffers of the same size,
+    for update_parameters_with_adam_flat().
+    
+    Arguments:
+    parameters -- python dictionary containing your parameters.
+                    parameters["W" + str(l)] = Wl
+                    parameters["b" + str(l)] = bl
+    
+    Returns:
+    parameters -- python dictionary with the same keys and values, now views into state["theta"]
+    state -- python dictionary containing:
+                    keys -- the parameter names, in buffer order
+                    theta -- flat buffer of the parameters
+                    grads -- flat buffer the gradients are gathered into at each step
+                    v, s -- moving averages of the gradient and of the squared gradient, initialized with zeros
+                    tmp, tmp2 -- scratch buffers
+    """
+    
+    keys = list(parameters.keys())
+    theta = np.concatenate([parameters[key].ravel() for key in keys])
+    
+    views = {}
+    offset = 0
+    for key in keys:
+        views[key] = theta[offset:offset + parameters[key].size].reshape(parameters[key].shape)
+        offset += parameters[key].size
+    
+    state = {"keys": keys, "theta": theta}
+    for name in ["grads", "v", "s", "tmp", "tmp2"]:
+        state[name] = np.zeros_like(theta)
+    
+    return views, state
+
+
+def update_parameters_with_adam_flat(parameters, grads, state, t, learning_rate = 0.01,
+                                     beta1 = 0.9, beta2 = 0.999,  epsilon = 1e-8):
+    """
+    update_parameters_with_adam() on the flat buffers of initialize_adam_flat(): the same operations in the
+    same order, so the same results, but applied in place to all the layers at once.
+    
+    Arguments:
+    parameters -- the parameters returned by initialize_adam_flat()
+    grads -- python dictionary containing your gradients for each parameters:
+                    grads['dW' + str(l)] = dWl
+                    grads['db' + str(l)] = dbl
+    state -- the state returned by initialize_adam_flat(), updated in place
+    t -- Adam variable, counts the number of taken steps
+    learning_rate -- the learning rate, scalar.
+    beta1 -- Exponential decay hyperparameter for the first moment estimates 
+    beta2 -- Exponential decay hyperparameter for the second moment estimates 
+    epsilon -- hyperparameter preventing division by zero in Adam updates
+
+    Returns:
+    parameters -- the same dictionary, whose arrays were updated in place
+    """
+    theta, g, v, s, tmp, tmp2 = state["theta"], state["grads"], state["v"], state["s"], state["tmp"], state["tmp2"]
+    np.concatenate([grads["d" + key].ravel() for key in state["keys"]], out=g)
+    
+    # v = beta1 * v + (1 - beta1) * g
+    np.multiply(v, beta1, out=v)
+    np.multiply(g, 1 - beta1, out=tmp)
+    np.add(v, tmp, out=v)
+    
+    # s = beta2 * s + (1 - beta2) * g ** 2
+    np.multiply(s, beta2, out=s)
+    np.square(g, out=tmp)
+    np.multiply(tmp, 1 - beta2, out=tmp)
+    np.add(s, tmp, out=s)
+    
+    # theta = theta - learning_rate * v_corrected / sqrt(s_corrected + epsilon)
+    np.divide(s, 1 - beta2 ** t, out=tmp)
+    np.add(tmp, epsilon, out=tmp)
+    np.sqrt(tmp, out=tmp)
+    np.divide(v, 1 - beta1 ** t, out=tmp2)
+    np.multiply(tmp2, learning_rate, out=tmp2)
+    np.divide(tmp2, tmp, out=tmp2)
+    np.subtract(theta, tmp2, out=theta)
+    
+    return parameters
+
+
+def benchmark_adam_flat(layers_dims, num_steps = 100):
+    """
+    Time the per-step cost of update_parameters_with_adam() against update_parameters_with_adam_flat() on
+    random parameters and gradients of the given shapes, checking on the way that both give the same parameters.
+    
+    Arguments:
+    layers_dims -- python list, containing the size of each layer, e.g. [10] + [64] * 20 + [1]
+    num_steps -- number of timed steps per version
+    
+    Returns:
+    dictionary_seconds, flat_seconds -- time per step of each version, in seconds
+    """
+    import time
+    
+    np.random.seed(1)
+    parameters = {}
+    for l in range(1, len(layers_dims)):
+        parameters["W" + str(l)] = np.random.randn(layers_dims[l], layers_dims[l-1]) * 0.01
+        parameters["b" + str(l)] = np.zeros((layers_dims[l], 1))
+    grads = {"d" + key: np.random.randn(*value.shape) for key, value in parameters.items()}
+    
+    reference = {key: value.copy() for key, value in parameters.items()}
+    v, s = initialize_adam(reference)
+    start = time.perf_counter()
+    for t in range(1, num_steps + 1):
+        reference, v, s = update_parameters_with_adam(reference, grads, v, s, t)
+    dictionary_seconds = (time.perf_counter() - start) / num_steps
+    
+    flat, state = initialize_adam_flat(parameters)
+    start = time.perf_counter()
+    for t in range(1, num_steps + 1):
+        flat = update_parameters_with_adam_flat(flat, grads, state, t)
+    flat_seconds = (time.perf_counter() - start) / num_steps
+    
+    identical = all(np.array_equal(reference[key], flat[key]) for key in parameters)
+    print("dictionary {:8.1f} us/step   flat {:8.1f} us/step   speedup x{:.2f}   identical: {}".format(
+        1e6 * dictionary_seconds, 1e6 * flat_seconds, dictionary_seconds / flat_seconds, identical))
+    
+    return dictionary_seconds, flat_seconds